@@ -3,20 +3,32 @@ Base Agent - 基础Agent类，提供与Claude API交互的能力
 
 Context管理策略参考: docs/productization/agent_context_strategy.md
 """
+import asyncio
+import atexit
 import os
-import json
+import hashlib
+import re
 import logging
+import logging.handlers
+import queue
+import threading
+from bisect import bisect_right
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Dict, Any, List, Optional, Callable
+from itertools import accumulate
+from typing import Dict, Any, List, Optional, Callable, Tuple
 from anthropic import Anthropic
+from anthropic.types import TextBlock, ToolUseBlock
 import httpx
+import orjson
 from rich.console import Console
+from rich.text import Text
 
 # 配置日志 - 写入文件，不输出到terminal
+# 日志级别默认DEBUG，可用环境变量 AGENT_LOG_LEVEL（或 main.py --log-level）调高以减少日志量
 logger = logging.getLogger(__name__)
 if not logger.handlers:
-    logger.setLevel(logging.DEBUG)
     # 日志文件handler
     log_dir = os.path.join(os.path.dirname(__file__), "..", "logs")
     os.makedirs(log_dir, exist_ok=True)
@@ -28,15 +40,92 @@ if not logger.handlers:
     file_handler.setFormatter(logging.Formatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     ))
-    logger.addHandler(file_handler)
+    # 日志经队列交给后台线程写文件，Agent主循环不等磁盘I/O（进程退出时写完剩余日志）
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
     # 阻止传播到root logger（避免输出到terminal）
     logger.propagate = False
 
+    _log_level = (os.getenv("AGENT_LOG_LEVEL") or "DEBUG").upper()
+    if isinstance(logging.getLevelName(_log_level), int):
+        logger.setLevel(_log_level)
+    else:
+        logger.setLevel(logging.DEBUG)
+        logger.warning(f"AGENT_LOG_LEVEL={_log_level} 不是有效的日志级别，使用DEBUG")
+
 # 创建一个全局 Console 用于格式化输出
 _console = Console()
+# 输出不是终端（重定向到日志文件、CI）时，逐块输出的内容直接写纯文本，跳过Rich渲染
+_CONSOLE_IS_TERMINAL = _console.is_terminal
+
+
+def _dumps(obj: Any) -> str:
+    """序列化为JSON字符串（orjson，非ASCII字符原样输出）"""
+    return orjson.dumps(obj).decode("utf-8")
 
 
-@dataclass
+def _preview_input(tool_input: Dict[str, Any], limit: int) -> str:
+    """
+    工具参数的截断预览（用于日志/终端显示）
+
+    先截断过长的字符串参数（如完整文件内容）再序列化，避免为了显示前几十个字符序列化整个参数
+    """
+    truncated = {
+        key: value[:limit] if isinstance(value, str) and len(value) > limit else value
+        for key, value in tool_input.items()
+    }
+    preview = _dumps(truncated)
+    return preview if len(preview) <= limit else preview[:limit] + "..."
+
+
+# Anthropic客户端池: (base_url, api_key) -> client（客户端线程安全，可跨Agent共享）
+_CLIENT_POOL: Dict[Tuple[str, str], Anthropic] = {}
+_CLIENT_POOL_LOCK = threading.Lock()
+
+# Prompt caching断点（Anthropic最多允许4个，这里使用: tools、system、history末尾共3个）
+_EPHEMERAL_CACHE = {"type": "ephemeral"}
+
+# Token估算：按字符类别加权（中文约0.55 token/字，数字约0.4，其余按chars_per_token折算）
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+_DIGIT_PATTERN = re.compile(r"[0-9]")
+_CJK_TOKEN_RATIO = 0.55
+_DIGIT_TOKEN_RATIO = 0.4
+# 抽取式压缩：文件路径 / 含数字的ID类标识符
+_FILE_PATH_PATTERN = re.compile(r"[\w./-]+\.(?:py|jsonl|json|md|yaml|yml|txt)\b")
+_IDENTIFIER_PATTERN = re.compile(r"\b(?=[A-Za-z_-]*\d)[A-Za-z0-9_-]{8,64}\b")
+# 抽取式压缩时原样保留结果的工具（文件写入类，结果即"已创建/修改的文件"）
+_EXTRACTIVE_RESULT_TOOLS = frozenset({"file_writer", "file_editor"})
+# 抽取式压缩时扫描tool_use参数的最大长度（更长的一般是文件内容，不扫描）
+_EXTRACTIVE_INPUT_SCAN_LIMIT = 1000
+_EXTRACTIVE_MAX_ITEMS = 200
+
+# 按block类型分派的文本提取（无文本的block返回None）
+_BLOCK_TEXT_EXTRACTORS: Dict[type, Callable[[Any], Optional[str]]] = {
+    TextBlock: lambda block: block.text,
+    ToolUseBlock: lambda block: None,
+    dict: lambda block: block.get("text", "") if block.get("type") == "text" else None,
+}
+
+
+def _extract_block_text(block: Any) -> Optional[str]:
+    """提取content block中的文本，未登记的类型退回到按text属性判断"""
+    extractor = _BLOCK_TEXT_EXTRACTORS.get(type(block))
+    if extractor is not None:
+        return extractor(block)
+    return getattr(block, "text", None)
+
+
+# 内容重复的tool_result去重的最小长度（字符）
+_DEDUP_MIN_CHARS = 500
+
+# 单条消息token计数缓存的上限（超过后整体清空，避免长期运行时无限增长）
+_TOKEN_COUNT_CACHE_LIMIT = 4096
+
+
+@dataclass(slots=True)
 class AgentResult:
     """Agent执行结果"""
     status: str  # "completed" | "need_approval" | "need_layer1_fix" | "failed"
@@ -45,7 +134,7 @@ class AgentResult:
     context_for_handoff: Optional[Dict[str, Any]] = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Tool:
     """工具定义"""
     name: str
@@ -54,7 +143,7 @@ class Tool:
     handler: Callable[..., str]
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ContextConfig:
     """Context管理配置"""
     # Compact触发阈值（tokens）
@@ -65,6 +154,15 @@ class ContextConfig:
     keep_recent_steps: int = 3
     # 每token约4字符（粗略估计）
     chars_per_token: int = 4
+    # 待压缩history中工具IO（tool_use参数 + tool_result）token占比超过该值时，
+    # 使用抽取式压缩（不调用LLM）；否则用LLM生成Summary
+    extractive_tool_io_ratio: float = 0.7
+    # History压平后连续同角色文本消息合并的长度上限（字符），超过后另起一条
+    history_merge_max_chars: int = 8000
+    # 上下文达到 compact_threshold 的该比例时，在后台线程提前压缩history前缀
+    background_compact_ratio: float = 0.75
+    # 上次压缩后上下文至少再增长这么多tokens才再次后台压缩（压缩后仍高于触发线时避免反复压缩）
+    background_compact_min_growth: int = 20_000
 
 
 class BaseAgent(ABC):
@@ -85,6 +183,37 @@ class BaseAgent(ABC):
     # 默认配置，子类可覆盖
     DEFAULT_CONTEXT_CONFIG = ContextConfig()
 
+    # 需要在主线程执行的工具（交互式输入），流式响应时不提前执行
+    _MAIN_THREAD_TOOLS = frozenset({"ask_human"})
+
+    # 只读工具（子类声明）：相邻的只读调用可以并发执行
+    _READ_ONLY_TOOLS: frozenset = frozenset()
+    # 只读工具的最大并发数
+    TOOL_CONCURRENCY_LIMIT = 4
+
+    @classmethod
+    def _get_shared_client(cls, base_url: Optional[str], api_key: Optional[str]) -> Anthropic:
+        """按 (base_url, api_key) 复用Anthropic客户端，避免每个Agent各建一套连接"""
+        key = (base_url or "", api_key or "")
+        with _CLIENT_POOL_LOCK:
+            client = _CLIENT_POOL.get(key)
+            if client is None:
+                # 创建客户端（设置长超时，支持大 max_tokens）
+                client_kwargs = {
+                    "timeout": httpx.Timeout(600.0, connect=10.0),  # 10分钟超时
+                    "http_client": httpx.Client(
+                        timeout=httpx.Timeout(600.0, connect=10.0),
+                        limits=httpx.Limits(max_keepalive_connections=20),
+                    ),
+                }
+                if api_key:
+                    client_kwargs["api_key"] = api_key
+                if base_url:
+                    client_kwargs["base_url"] = base_url
+                client = Anthropic(**client_kwargs)
+                _CLIENT_POOL[key] = client
+        return client
+
     def __init__(
         self,
         model: str = "claude-sonnet-4-20250514",
@@ -99,16 +228,8 @@ class BaseAgent(ABC):
         self.base_url = base_url or os.environ.get("ANTHROPIC_BASE_URL")
         self.api_key = api_key or os.environ.get("ANTHROPIC_API_KEY")
 
-        # 创建客户端（设置长超时，支持大 max_tokens）
-        client_kwargs = {
-            "timeout": httpx.Timeout(600.0, connect=10.0)  # 10分钟超时
-        }
-        if self.api_key:
-            client_kwargs["api_key"] = self.api_key
-        if self.base_url:
-            client_kwargs["base_url"] = self.base_url
-
-        self.client = Anthropic(**client_kwargs)
+        # 获取客户端（相同端点+密钥的Agent共享，复用连接池）
+        self.client = self._get_shared_client(self.base_url, self.api_key)
         self.model = model
         self.max_iterations = max_iterations
         self.tools = tools or []
@@ -118,8 +239,13 @@ class BaseAgent(ABC):
         self.context_config = context_config or self.DEFAULT_CONTEXT_CONFIG
 
         # 对话历史（用于 checkpoint/resume）
+        # run()中与raw_messages是同一个列表对象（不再每步拷贝），外部只读
         self._conversation_history: List[Dict] = []
 
+        # 对话历史写出游标（checkpoint增量序列化用，见 get_new_history_since_cursor）
+        self._history_write_cursor = 0
+        self._history_cursor_source: Optional[List[Dict]] = None
+
         # 缓存最后一次的system_prompt和context（用于manual_compact）
         self._last_system_prompt: str = ""
         self._last_context: Dict[str, Any] = {}
@@ -127,10 +253,48 @@ class BaseAgent(ABC):
         # 工具调用完成回调（用于触发checkpoint保存）
         self.on_tool_call_complete = on_tool_call_complete
 
+        # Compact后已知的上下文token数（追加新消息后失效，见 _append_message）
+        self._last_known_tokens: Optional[int] = None
+
+        # 最近一次构建的API messages中缓存断点所在的下标（-1表示不设置）
+        self._cache_breakpoint_index = -1
+
+        # History增量处理缓存（避免每轮重新遍历整个对话历史）
+        self._reset_processed_history_cache()
+
+        # 单条消息token计数缓存: id(msg) -> (content, tokens)
+        self._token_count_cache: Dict[int, tuple] = {}
+        # System prompt token计数缓存: (system_prompt, tokens)
+        self._system_prompt_tokens: tuple = (None, 0)
+
+        # 有副作用工具的执行线程（单worker，保证工具按调用顺序执行）
+        self._tool_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool-call")
+        # 只读工具的并发执行线程（见 _dispatch_tool_call）
+        self._read_tool_executor = ThreadPoolExecutor(
+            max_workers=self.TOOL_CONCURRENCY_LIMIT, thread_name_prefix="tool-read"
+        )
+
+        # 后台Compact线程（见 _maybe_start_background_compaction）
+        self._compactor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="compact")
+        self._compaction_future: Optional[Future] = None
+        self._compaction_source: Optional[List[Dict]] = None
+        self._compaction_split = 0
+        # 上次压缩（前台或后台）完成后的上下文tokens
+        self._compacted_at_tokens: Optional[int] = None
+
+        # run_async运行中持有（对话历史、工具线程属于实例，同一实例不能并发运行）
+        self._async_run_lock = threading.Lock()
+
         # 注册工具处理器
         for tool in self.tools:
             self._tool_handlers[tool.name] = tool.handler
 
+        # 预先生成工具定义和system块（run的每个iteration复用同一对象）
+        self._tool_definitions_key: Optional[tuple] = None
+        self._tool_definitions_cache: List[Dict[str, Any]] = []
+        self._system_blocks_cache: List[Dict[str, Any]] = []
+        self._get_tool_definitions()
+
     @abstractmethod
     def get_system_prompt(self, context: Dict[str, Any]) -> str:
         """获取系统提示词"""
@@ -151,8 +315,17 @@ class BaseAgent(ABC):
         return None
 
     def _get_tool_definitions(self) -> List[Dict[str, Any]]:
-        """获取工具定义（Anthropic格式）"""
-        return [
+        """
+        获取工具定义（Anthropic格式）
+
+        最后一个工具挂载cache_control，使全部工具schema共享一个缓存断点。
+        结果按self.tools缓存，仅在工具列表变化时重建。
+        """
+        key = tuple(map(id, self.tools))
+        if self._tool_definitions_key == key:
+            return self._tool_definitions_cache
+
+        definitions = [
             {
                 "name": tool.name,
                 "description": tool.description,
@@ -160,18 +333,80 @@ class BaseAgent(ABC):
             }
             for tool in self.tools
         ]
+        if definitions:
+            definitions[-1]["cache_control"] = _EPHEMERAL_CACHE
+        self._tool_definitions_key = key
+        self._tool_definitions_cache = definitions
+        return definitions
+
+    def _build_system_blocks(self, system_prompt: str) -> List[Dict[str, Any]]:
+        """将system prompt包装为带cache_control的文本块（缓存层级: Tools → System → Messages）"""
+        if self._system_blocks_cache and self._system_blocks_cache[0]["text"] == system_prompt:
+            return self._system_blocks_cache
+        self._system_blocks_cache = [{"type": "text", "text": system_prompt, "cache_control": _EPHEMERAL_CACHE}]
+        return self._system_blocks_cache
+
+    def _apply_message_cache_breakpoint(self, api_messages: List[Dict]) -> List[Dict]:
+        """
+        在最后一条稳定的history消息上设置缓存断点
+
+        History部分已被压平为纯文本且只会在末尾追加（最后一条可能还会被合并），
+        除最后一条外是跨iteration不变的前缀；最近N步每轮都在变化，不参与缓存。
+        返回新列表，不修改原消息。
+        """
+        index = self._cache_breakpoint_index
+        if index < 0 or index >= len(api_messages):
+            return api_messages
+
+        message = api_messages[index]
+        if not isinstance(message.get("content"), str):
+            return api_messages
+
+        marked = list(api_messages)
+        marked[index] = {
+            "role": message["role"],
+            "content": [{"type": "text", "text": message["content"], "cache_control": _EPHEMERAL_CACHE}]
+        }
+        return marked
 
     def _handle_tool_call(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
         """处理工具调用"""
         if tool_name not in self._tool_handlers:
-            return json.dumps({"error": f"Unknown tool: {tool_name}"})
+            return _dumps({"error": f"Unknown tool: {tool_name}"})
 
         handler = self._tool_handlers[tool_name]
         try:
             result = handler(**tool_input)
-            return result if isinstance(result, str) else json.dumps(result, ensure_ascii=False)
+            if isinstance(result, str):
+                return result
+            if isinstance(result, bytes):
+                return result.decode("utf-8")
+            return _dumps(result)
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return _dumps({"error": str(e)})
+
+    def get_new_history_since_cursor(self) -> List[Dict]:
+        """
+        返回自上次 advance_history_cursor() 之后新增的对话消息
+
+        供 on_tool_call_complete 回调（checkpoint）只处理新增的尾部，而不是每次全量序列化。
+        对话历史列表被替换（新对话、Compact压缩、从checkpoint恢复）时游标归零，返回完整历史，
+        调用方可通过 history_write_cursor == 0 判断需要整体重写。
+        """
+        if self._history_cursor_source is not self._conversation_history:
+            self._history_cursor_source = self._conversation_history
+            self._history_write_cursor = 0
+        return self._conversation_history[self._history_write_cursor:]
+
+    def advance_history_cursor(self):
+        """将写出游标移动到当前对话历史末尾"""
+        self._history_cursor_source = self._conversation_history
+        self._history_write_cursor = len(self._conversation_history)
+
+    @property
+    def history_write_cursor(self) -> int:
+        """当前写出游标位置"""
+        return self._history_write_cursor
 
     def _after_tool_execution(self, response, raw_messages: List[Dict]):
         """
@@ -188,24 +423,69 @@ class BaseAgent(ABC):
     # ========== Context 管理 ==========
 
     def _estimate_tokens(self, text: str) -> int:
-        """粗略估计token数量"""
-        return len(text) // self.context_config.chars_per_token
+        """按字符类别加权估计token数量（中文、数字、其他字符分别折算）"""
+        if not text:
+            return 0
+        digits = len(_DIGIT_PATTERN.findall(text))
+        cjk = 0 if text.isascii() else len(_CJK_PATTERN.findall(text))
+        others = len(text) - cjk - digits
+        return int(
+            cjk * _CJK_TOKEN_RATIO
+            + digits * _DIGIT_TOKEN_RATIO
+            + others / self.context_config.chars_per_token
+        )
+
+    def _estimate_block_tokens(self, item: Any) -> int:
+        """估计单个content block的token数（直接取文本字段，不序列化整个block）"""
+        if isinstance(item, dict):
+            item_type = item.get("type")
+            if item_type == "text":
+                return self._estimate_tokens(item.get("text", ""))
+            if item_type == "tool_result":
+                content = item.get("content", "")
+                if isinstance(content, str):
+                    return self._estimate_tokens(content)
+                return sum(self._estimate_block_tokens(sub) for sub in content)
+            if item_type == "tool_use":
+                return self._estimate_tokens(_dumps(item.get("input", {})))
+            return self._estimate_tokens(_dumps(item))
+        if hasattr(item, "text"):
+            return self._estimate_tokens(item.text)
+        if hasattr(item, "input"):
+            return self._estimate_tokens(_dumps(item.input))
+        return self._estimate_tokens(str(item))
+
+    def _message_tokens(self, msg: Dict) -> int:
+        """估计单条消息的token数（按消息缓存，只在content被替换时重新计算）"""
+        content = msg.get("content", "")
+        cached = self._token_count_cache.get(id(msg))
+        # 同时校验content对象身份，防止id复用或content被替换后命中旧值
+        if cached is not None and cached[0] is content:
+            return cached[1]
+
+        if isinstance(content, str):
+            tokens = self._estimate_tokens(content)
+        elif isinstance(content, list):
+            # tool_use 或 tool_result 列表
+            tokens = sum(self._estimate_block_tokens(item) for item in content)
+        else:
+            tokens = 0
+        self._token_count_cache[id(msg)] = (content, tokens)
+        return tokens
+
+    def _system_prompt_token_count(self, system_prompt: str) -> int:
+        """估计system prompt的token数（同一次run中system prompt不变，只计算一次）"""
+        cached_prompt, tokens = self._system_prompt_tokens
+        if cached_prompt is not system_prompt:
+            tokens = self._estimate_tokens(system_prompt)
+            self._system_prompt_tokens = (system_prompt, tokens)
+        return tokens
 
     def _estimate_messages_tokens(self, messages: List[Dict]) -> int:
-        """估计messages的总token数"""
-        total = 0
-        for msg in messages:
-            content = msg.get("content", "")
-            if isinstance(content, str):
-                total += self._estimate_tokens(content)
-            elif isinstance(content, list):
-                # tool_use 或 tool_result 列表
-                for item in content:
-                    if isinstance(item, dict):
-                        total += self._estimate_tokens(json.dumps(item, ensure_ascii=False))
-                    else:
-                        total += self._estimate_tokens(str(item))
-        return total
+        """估计messages的总token数（消息在追加时已计数，这里基本只是求和）"""
+        if len(self._token_count_cache) > _TOKEN_COUNT_CACHE_LIMIT:
+            self._token_count_cache.clear()
+        return sum(map(self._message_tokens, messages))
 
     def _format_messages_summary(self, messages: List[Dict]) -> str:
         """格式化messages的概览（用于日志）"""
@@ -252,15 +532,26 @@ class BaseAgent(ABC):
         recent_count = n * 2
 
         if len(raw_messages) <= recent_count:
+            self._cache_breakpoint_index = -1
             return raw_messages
 
         # 分离 history 和 recent
-        history = raw_messages[:-recent_count]
-        recent = raw_messages[-recent_count:]
+        cut = len(raw_messages) - recent_count
+        recent = raw_messages[cut:]
+
+        # raw_messages只会在末尾追加，history部分增量处理即可；
+        # 换了一个列表（新对话/Compact）或列表变短时重新处理
+        if self._processed_source is not raw_messages or cut < self._processed_upto:
+            self._reset_processed_history_cache()
+            self._processed_source = raw_messages
+
+        # 只处理本轮新降级为history的消息
+        new_history = raw_messages[self._processed_upto:cut]
+        preserved_tool_use_ids = self._preserved_tool_use_ids
+        processed_history = self._processed_history_cache
 
         # 收集history中保留的所有tool_use_id
-        preserved_tool_use_ids = set()
-        for msg in history:
+        for msg in new_history:
             if msg.get("role") == "assistant":
                 content = msg.get("content")
                 if isinstance(content, list):
@@ -269,8 +560,7 @@ class BaseAgent(ABC):
                             preserved_tool_use_ids.add(block.get("id"))
 
         # 处理 history：删除 tool_use 和 tool_result，只保留纯文本
-        processed_history = []
-        for msg in history:
+        for msg in new_history:
             role = msg.get("role")
             content = msg.get("content")
 
@@ -285,30 +575,32 @@ class BaseAgent(ABC):
                             # tool_result被跳过
 
                     if text_blocks:
-                        processed_history.append({
+                        self._append_history_message(processed_history, {
                             "role": "user",
                             "content": "\n".join(text_blocks)
                         })
                 elif isinstance(content, str):
-                    processed_history.append(msg)
+                    self._append_history_message(processed_history, msg)
 
             elif role == "assistant":
                 if isinstance(content, str):
-                    processed_history.append(msg)
+                    self._append_history_message(processed_history, msg)
                 elif isinstance(content, list):
-                    text_parts = []
-                    for block in content:
-                        if hasattr(block, "text"):
-                            text_parts.append(block.text)
-                        elif isinstance(block, dict) and block.get("type") == "text":
-                            text_parts.append(block.get("text", ""))
+                    text_parts = [
+                        text for text in map(_extract_block_text, content) if text is not None
+                    ]
 
                     if text_parts:
-                        processed_history.append({
+                        self._append_history_message(processed_history, {
                             "role": "assistant",
                             "content": "\n".join(text_parts)
                         })
 
+        self._processed_upto = cut
+
+        # 重复的大段tool_result只保留最后一次完整内容，之前的替换为引用
+        duplicated_results = self._find_duplicated_tool_results(recent)
+
         # 处理recent：检查tool_result是否有对应的tool_use
         # 如果tool_use在history中被删除了，这里的tool_result也必须删除
         processed_recent = []
@@ -326,6 +618,8 @@ class BaseAgent(ABC):
                         # 如果在preserved_tool_use_ids中，说明tool_use被删了，这个result也要删
                         if tool_use_id not in preserved_tool_use_ids:
                             # tool_use不在history的删除列表中，保留这个result
+                            if id(item) in duplicated_results:
+                                item = {**item, "content": duplicated_results[id(item)]}
                             filtered_content.append(item)
                         # 否则跳过这个tool_result
                     else:
@@ -341,12 +635,84 @@ class BaseAgent(ABC):
                 # 其他消息直接保留
                 processed_recent.append(msg)
 
+        # 最后一条history消息之后还可能被合并，缓存断点设在倒数第二条
+        self._cache_breakpoint_index = len(processed_history) - 2
         return processed_history + processed_recent
 
+    def _find_duplicated_tool_results(self, messages: List[Dict]) -> Dict[int, str]:
+        """
+        查找内容重复的大段tool_result（如反复读取同一文件）
+
+        Returns:
+            {id(重复的tool_result块): 替换文本}，最后一次出现的不在其中
+        """
+        last_occurrence: Dict[str, str] = {}
+        occurrences = []
+        for msg in messages:
+            content = msg.get("content")
+            if msg.get("role") != "user" or not isinstance(content, list):
+                continue
+            for item in content:
+                if not isinstance(item, dict) or item.get("type") != "tool_result":
+                    continue
+                result = item.get("content")
+                if not isinstance(result, str) or len(result) < _DEDUP_MIN_CHARS:
+                    continue
+                digest = hashlib.sha1(result.encode("utf-8")).hexdigest()
+                last_occurrence[digest] = item.get("tool_use_id")
+                occurrences.append((item, digest))
+
+        duplicated = {}
+        for item, digest in occurrences:
+            latest_id = last_occurrence[digest]
+            if item.get("tool_use_id") != latest_id:
+                duplicated[id(item)] = f"[dedup:{digest[:8]}] 内容与后面的 tool_result {latest_id} 完全相同，见该结果"
+        return duplicated
+
+    def _append_history_message(self, processed_history: List[Dict], msg: Dict):
+        """
+        追加压平后的history消息，与上一条同角色的文本消息合并
+
+        删除tool块后常出现连续的同角色消息，合并可以减少消息条数和请求体积。
+        合并总是生成新dict，不修改原始消息；超过长度上限时另起一条。
+        """
+        if processed_history:
+            last = processed_history[-1]
+            if (
+                last["role"] == msg["role"]
+                and isinstance(last["content"], str)
+                and len(last["content"]) + len(msg["content"]) < self.context_config.history_merge_max_chars
+            ):
+                processed_history[-1] = {
+                    "role": msg["role"],
+                    "content": last["content"] + "\n" + msg["content"]
+                }
+                return
+        processed_history.append(msg)
+
+    def _reset_processed_history_cache(self):
+        """清空history增量处理缓存（messages列表被替换时调用）"""
+        self._processed_source: Optional[List[Dict]] = None
+        self._processed_history_cache: List[Dict] = []
+        self._processed_upto = 0
+        self._preserved_tool_use_ids: set = set()
+
+    def _estimate_context_tokens(self, messages: List[Dict], system_prompt: str) -> int:
+        """估计本次请求的上下文token数"""
+        # Compact后尚未追加新消息时，压缩结果的token数已知（raw消息数是API消息的上界）
+        if self._last_known_tokens is not None:
+            return self._last_known_tokens
+        return self._system_prompt_token_count(system_prompt) + self._estimate_messages_tokens(messages)
+
     def _should_compact(self, messages: List[Dict], system_prompt: str) -> bool:
         """检查是否需要触发Compact"""
-        total_tokens = self._estimate_tokens(system_prompt) + self._estimate_messages_tokens(messages)
-        return total_tokens > self.context_config.compact_threshold
+        return self._estimate_context_tokens(messages, system_prompt) > self.context_config.compact_threshold
+
+    def _append_message(self, raw_messages: List[Dict], message: Dict):
+        """追加消息到对话历史（追加时即计数，并使已知的token统计失效）"""
+        raw_messages.append(message)
+        self._message_tokens(message)
+        self._last_known_tokens = None
 
     def _generate_summary(self, messages: List[Dict], system_prompt: str) -> str:
         """生成Summary（通过Mock user消息让LLM总结）"""
@@ -407,12 +773,9 @@ class BaseAgent(ABC):
                     text_only_messages.append(msg)
                 elif isinstance(content, list):
                     # 只提取text，忽略tool_use
-                    text_parts = []
-                    for block in content:
-                        if hasattr(block, "text"):
-                            text_parts.append(block.text)
-                        elif isinstance(block, dict) and block.get("type") == "text":
-                            text_parts.append(block.get("text", ""))
+                    text_parts = [
+                        text for text in map(_extract_block_text, content) if text is not None
+                    ]
                     if text_parts:
                         text_only_messages.append({
                             "role": "assistant",
@@ -420,12 +783,19 @@ class BaseAgent(ABC):
                         })
 
         # 如果还是太长，只保留最近的消息
-        estimated_tokens = self._estimate_tokens(system_prompt) + self._estimate_messages_tokens(text_only_messages) + 1000
+        system_tokens = self._system_prompt_token_count(system_prompt)
+        estimated_tokens = system_tokens + self._estimate_messages_tokens(text_only_messages) + 1000
         if estimated_tokens > self.context_config.api_hard_limit - 4000:  # 留4000给summary输出
-            # 保留第一条和最后50条消息
-            logger.warning(f"对话历史太长({estimated_tokens} tokens)，只使用最近50条消息生成summary")
+            # 保留第一条 + 从末尾往前、在token预算内能放下的最多消息
             first_msg = text_only_messages[0] if text_only_messages else {"role": "user", "content": ""}
-            recent_msgs = text_only_messages[-50:] if len(text_only_messages) > 50 else text_only_messages[1:]
+            budget = (self.context_config.api_hard_limit - 4000 - system_tokens
+                      - self._estimate_messages_tokens([first_msg]) - 1000)
+            tail_tokens = list(accumulate(
+                self._estimate_messages_tokens([msg]) for msg in reversed(text_only_messages[1:])
+            ))
+            keep = bisect_right(tail_tokens, budget)
+            logger.warning(f"对话历史太长({estimated_tokens} tokens)，只使用最近{keep}条消息生成summary")
+            recent_msgs = text_only_messages[len(text_only_messages) - keep:] if keep else []
             text_only_messages = [first_msg] + recent_msgs
 
         messages_for_compact = text_only_messages + [compact_prompt]
@@ -445,6 +815,101 @@ class BaseAgent(ABC):
 
         return summary_text
 
+    def _tool_io_ratio(self, messages: List[Dict]) -> float:
+        """计算messages中工具IO（tool_use参数 + tool_result）所占的token比例"""
+        tool_io_tokens = 0
+        total_tokens = 0
+        for msg in messages:
+            content = msg.get("content")
+            if isinstance(content, str):
+                total_tokens += self._estimate_tokens(content)
+                continue
+            if not isinstance(content, list):
+                continue
+            for item in content:
+                tokens = self._estimate_block_tokens(item)
+                total_tokens += tokens
+                item_type = item.get("type") if isinstance(item, dict) else getattr(item, "type", None)
+                if item_type in ("tool_use", "tool_result"):
+                    tool_io_tokens += tokens
+        return tool_io_tokens / total_tokens if total_tokens else 0.0
+
+    def _extractive_compact(self, messages: List[Dict]) -> str:
+        """
+        抽取式压缩（不调用LLM）
+
+        从history中原样抽取: 文件路径、ID类标识符、文件写入类工具的结果、
+        用户最后一条文本消息和Agent最近的说明，拼成<extracted_facts>块
+        """
+        paths: Dict[str, None] = {}
+        identifiers: Dict[str, None] = {}
+        file_operations: List[str] = []
+        user_texts: List[str] = []
+        assistant_texts: List[str] = []
+        tool_names: Dict[str, str] = {}
+        previous_summaries: List[str] = []
+
+        def scan(text: str):
+            for match in _FILE_PATH_PATTERN.findall(text):
+                paths[match] = None
+            for match in _IDENTIFIER_PATTERN.findall(text):
+                identifiers[match] = None
+
+        for msg in messages[1:]:
+            role = msg.get("role")
+            content = msg.get("content")
+            if isinstance(content, str) and content.startswith("<compact_summary>"):
+                # 之前压缩生成的摘要原样保留（再次压缩时不能丢）
+                previous_summaries.append(content)
+                continue
+            if isinstance(content, str):
+                scan(content)
+                (user_texts if role == "user" else assistant_texts).append(content)
+                continue
+            if not isinstance(content, list):
+                continue
+            for item in content:
+                if isinstance(item, dict):
+                    item_type = item.get("type")
+                    if item_type == "text":
+                        text = item.get("text", "")
+                        scan(text)
+                        (user_texts if role == "user" else assistant_texts).append(text)
+                    elif item_type == "tool_result":
+                        result = item.get("content", "")
+                        if not isinstance(result, str):
+                            result = _dumps(result)
+                        scan(result)
+                        if tool_names.get(item.get("tool_use_id")) in _EXTRACTIVE_RESULT_TOOLS:
+                            file_operations.append(result[:300])
+                elif getattr(item, "type", None) == "text":
+                    scan(item.text)
+                    assistant_texts.append(item.text)
+                elif getattr(item, "type", None) == "tool_use":
+                    tool_names[item.id] = item.name
+                    for value in item.input.values():
+                        if isinstance(value, str) and len(value) <= _EXTRACTIVE_INPUT_SCAN_LIMIT:
+                            scan(value)
+
+        for path in paths:
+            identifiers.pop(path, None)
+
+        sections = ["<extracted_facts>"]
+        if previous_summaries:
+            sections.append("## 之前的压缩摘要\n" + "\n".join(previous_summaries))
+        if user_texts:
+            sections.append(f"## 用户最后一条消息\n{user_texts[-1]}")
+        if file_operations:
+            sections.append("## 文件写入记录\n" + "\n".join(file_operations[-_EXTRACTIVE_MAX_ITEMS:]))
+        if paths:
+            sections.append("## 涉及的文件路径\n" + "\n".join(list(paths)[-_EXTRACTIVE_MAX_ITEMS:]))
+        if identifiers:
+            sections.append("## 涉及的ID/标识符\n" + ", ".join(list(identifiers)[-_EXTRACTIVE_MAX_ITEMS:]))
+        if assistant_texts:
+            sections.append("## Agent最近的说明\n" + "\n---\n".join(t[:500] for t in assistant_texts[-3:]))
+        sections.append("</extracted_facts>")
+        return "\n\n".join(sections)
+
     def manual_compact(self) -> bool:
         """
         用户手动触发compact压缩
@@ -459,49 +924,252 @@ class BaseAgent(ABC):
         _console.print("[cyan]开始手动压缩对话历史...[/cyan]")
         # 使用缓存的system_prompt，如果没有则用最后的context重新生成
         system_prompt = self._last_system_prompt or self.get_system_prompt(self._last_context)
-        self._conversation_history = self._compact_messages(self._conversation_history, system_prompt)
+        self._conversation_history, _ = self._compact_messages(self._conversation_history, system_prompt)
         _console.print(f"[green]✓ 压缩完成，当前消息数: {len(self._conversation_history)}[/green]")
         return True
 
-    def _compact_messages(self, messages: List[Dict], system_prompt: str) -> List[Dict]:
+    def _summarize_for_compact(self, history: List[Dict], messages: List[Dict], system_prompt: str) -> str:
+        """
+        生成Compact用的Summary
+
+        待压缩的history以工具IO为主时抽取式压缩，否则基于messages调用LLM总结
+        """
+        tool_io_ratio = self._tool_io_ratio(history)
+        if tool_io_ratio >= self.context_config.extractive_tool_io_ratio:
+            logger.info(f"工具IO占比 {tool_io_ratio:.0%}，使用抽取式压缩")
+            return self._extractive_compact(history)
+        return self._generate_summary(messages, system_prompt)
+
+    def _assemble_compacted(self, messages: List[Dict], summary_text: str, keep_from: int) -> List[Dict]:
+        """构建压缩后的messages: 第一条真实user消息（原始需求） + Summary + messages[keep_from:]"""
+        first_user_message = messages[0] if messages else {"role": "user", "content": ""}
+
+        summary_message = {
+            "role": "assistant",
+            "content": f"<compact_summary>\n{summary_text}\n</compact_summary>"
+        }
+
+        return [first_user_message, summary_message] + messages[keep_from:]
+
+    def _maybe_start_background_compaction(self, raw_messages: List[Dict], system_prompt: str, total_tokens: int):
+        """
+        上下文接近Compact阈值时，在后台线程对history前缀生成Summary
+
+        主循环继续调用工具，Summary完成后由 _swap_in_background_compaction 在下一轮开始时替换前缀，
+        避免到达阈值时在前台阻塞等待压缩
+        """
+        if self._compaction_future is not None:
+            return
+        config = self.context_config
+        if total_tokens <= config.compact_threshold * config.background_compact_ratio:
+            return
+        if (self._compacted_at_tokens is not None
+                and total_tokens - self._compacted_at_tokens < config.background_compact_min_growth):
+            return
+
+        split = len(raw_messages) - config.keep_recent_steps * 2
+        if split <= 1:
+            return
+
+        prefix = raw_messages[:split]
+        logger.info(f"上下文 {total_tokens} tokens，后台压缩前 {split} 条messages")
+        self._compaction_source = raw_messages
+        self._compaction_split = split
+        self._compaction_future = self._compactor.submit(
+            self._summarize_for_compact, prefix, prefix, system_prompt
+        )
+
+    def _swap_in_background_compaction(self, raw_messages: List[Dict], wait: bool = False) -> List[Dict]:
+        """
+        后台压缩完成时，用Summary替换已压缩的前缀（之后新追加的消息原样保留）
+
+        Args:
+            wait: 是否等待尚未完成的后台压缩
+
+        Returns:
+            替换后的messages；没有可用结果时返回原列表
+        """
+        future = self._compaction_future
+        if future is None or (not wait and not future.done()):
+            return raw_messages
+        self._compaction_future = None
+
+        # 期间对话历史已被替换（前台Compact、新对话等），结果作废
+        if self._compaction_source is not raw_messages:
+            return raw_messages
+        self._compaction_source = None
+
+        try:
+            summary_text = future.result()
+        except Exception as e:
+            logger.warning(f"后台压缩失败，等待前台Compact: {e}")
+            return raw_messages
+
+        compressed = self._assemble_compacted(raw_messages, summary_text, self._compaction_split)
+        self._reset_processed_history_cache()
+        self._last_known_tokens = None
+        logger.info(f"后台压缩完成: {len(raw_messages)} -> {len(compressed)} 条messages")
+        return compressed
+
+    def _compact_messages(self, messages: List[Dict], system_prompt: str) -> tuple:
         """
         执行Compact压缩
 
         流程：
-        1. Mock user消息触发Summary生成
-        2. LLM生成Summary
+        1. 待压缩部分以工具IO为主时，抽取式压缩（路径、ID、文件写入结果原样保留）
+        2. 否则Mock user消息触发LLM生成Summary
         3. 构建压缩后的messages: 第一条真实user消息 + Summary + 最近N步
+
+        Returns:
+            (压缩后的messages, 压缩后messages的估计token数)
         """
         logger.info("触发Compact压缩...")
+        self._reset_processed_history_cache()
+        self._token_count_cache.clear()
 
         n = self.context_config.keep_recent_steps
         recent_count = n * 2
 
         # 生成Summary
-        summary_text = self._generate_summary(messages, system_prompt)
-
-        # 构建压缩后的messages
-        # 保留第一条user message（原始需求）
-        first_user_message = messages[0] if messages else {"role": "user", "content": ""}
-
-        summary_message = {
-            "role": "assistant",
-            "content": f"<compact_summary>\n{summary_text}\n</compact_summary>"
-        }
+        history = messages[:-recent_count] if len(messages) > recent_count else messages
+        summary_text = self._summarize_for_compact(history, messages, system_prompt)
 
         # 保留最近N步
-        recent_messages = messages[-recent_count:] if len(messages) >= recent_count else messages
-
-        compressed = [first_user_message, summary_message] + recent_messages
+        keep_from = len(messages) - recent_count if len(messages) >= recent_count else 0
+        compressed = self._assemble_compacted(messages, summary_text, keep_from)
 
         old_tokens = self._estimate_messages_tokens(messages)
         new_tokens = self._estimate_messages_tokens(compressed)
         logger.info(f"Compact完成: {old_tokens} -> {new_tokens} tokens")
 
-        return compressed
+        return compressed, new_tokens
 
     # ========== 主运行循环 ==========
 
+    def _stream_response(
+        self,
+        system_blocks: List[Dict],
+        tool_definitions: List[Dict],
+        api_messages: List[Dict]
+    ) -> tuple:
+        """
+        流式调用Claude，只读工具的tool_use块一结束就提交到工具线程执行
+
+        有副作用的工具（写文件、bash等）等消息完整接收后才提交：流式过程中连接出错时，
+        不会留下已经执行、却没有记录在对话历史中的调用（resume后会被重复执行）。
+        消息中第一个非只读调用之后的工具也等消息完整后再按顺序提交，保持读写顺序。
+        需要在主线程交互的工具（如ask_human）及其之后的工具不提交，
+        留给 _collect_tool_results 按顺序在主线程处理。
+
+        Returns:
+            (最终的response, {tool_use_id: Future})
+        """
+        dispatched: Dict[str, Future] = {}
+        # 遇到第一个非只读调用后，流式阶段不再提交
+        reads_only = True
+
+        try:
+            with self.client.messages.stream(
+                model=self.model,
+                max_tokens=32768,  # 32K - 平衡长度和响应时间
+                system=system_blocks,
+                tools=tool_definitions if tool_definitions else None,
+                messages=self._apply_message_cache_breakpoint(api_messages)
+            ) as stream:
+                for event in stream:
+                    if event.type != "content_block_stop":
+                        continue
+                    block = event.content_block
+                    if block.type == "text":
+                        # 打印到 terminal，让用户看到 Agent 思考过程
+                        if block.text.strip():
+                            # Agent 思考文本用淡色显示（完整输出，不截断；out()不做markup/高亮解析，长文本也不卡顿）
+                            if _CONSOLE_IS_TERMINAL:
+                                _console.out(f"  {block.text}", style="dim", highlight=False)
+                            else:
+                                _console.file.write(f"  {block.text}\n")
+                    elif block.type == "tool_use" and reads_only:
+                        if block.name not in self._READ_ONLY_TOOLS:
+                            reads_only = False
+                            continue
+                        # 此前没有提交过写操作，只读调用之间直接并发
+                        self._print_tool_call(block)
+                        dispatched[block.id] = self._read_tool_executor.submit(
+                            self._handle_tool_call_after, [], block.name, block.input
+                        )
+                response = stream.get_final_message()
+        except BaseException:
+            # 流式失败：尚未开始的调用取消，已在执行的只读调用等它结束后再向上抛出
+            for future in dispatched.values():
+                future.cancel()
+            wait(dispatched.values())
+            raise
+
+        self._dispatch_remaining_tool_calls(response, dispatched)
+        return response, dispatched
+
+    def _dispatch_remaining_tool_calls(self, response, dispatched: Dict[str, Future]):
+        """
+        消息完整后，按顺序提交流式阶段未提交的工具调用（到第一个主线程工具为止）
+
+        只读调用之间并发，但要等之前的写操作完成；其他调用在单线程中按顺序执行，并等之前的只读调用完成
+        """
+        # 流式阶段提交的都是消息开头的只读调用，后面的第一个写操作要等它们完成
+        last_serial: Optional[Future] = None
+        pending_reads: List[Future] = list(dispatched.values())
+        for block in response.content:
+            if block.type != "tool_use" or block.id in dispatched:
+                continue
+            if block.name in self._MAIN_THREAD_TOOLS:
+                break
+            self._print_tool_call(block)
+            if block.name in self._READ_ONLY_TOOLS:
+                future = self._read_tool_executor.submit(
+                    self._handle_tool_call_after, [last_serial] if last_serial else [], block.name, block.input
+                )
+                pending_reads.append(future)
+            else:
+                future = self._tool_executor.submit(
+                    self._handle_tool_call_after, pending_reads, block.name, block.input
+                )
+                last_serial = future
+                pending_reads = []
+            dispatched[block.id] = future
+
+    def _handle_tool_call_after(self, prerequisites: List[Future], tool_name: str, tool_input: Dict[str, Any]) -> str:
+        """等待前序调用完成后执行工具（_handle_tool_call不抛异常，前序失败不影响后续执行）"""
+        if prerequisites:
+            wait(prerequisites)
+        return self._handle_tool_call(tool_name, tool_input)
+
+    def _print_tool_call(self, block):
+        """在terminal打印工具调用（参数截断显示）"""
+        params_str = _preview_input(block.input, 100)
+        if not _CONSOLE_IS_TERMINAL:
+            _console.file.write(f"  调用工具: {block.name}({params_str})\n")
+            return
+        # 参数是模型生成的内容，用Text拼接而不是markup，避免其中的[...]被当作样式标签解析
+        _console.print(Text.assemble("  调用工具: ", (block.name, "cyan"), f"({params_str})"))
+
+    def _collect_tool_results(self, response, dispatched: Dict[str, Future]) -> List[Dict]:
+        """按tool_use顺序收集工具结果，未提交到工具线程的调用（主线程工具及其之后的）在主线程执行"""
+        tool_results = []
+        for block in response.content:
+            if block.type != "tool_use":
+                continue
+            future = dispatched.get(block.id)
+            if future is not None:
+                result = future.result()
+            else:
+                self._print_tool_call(block)
+                result = self._handle_tool_call(block.name, block.input)
+            tool_results.append({
+                "type": "tool_result",
+                "tool_use_id": block.id,
+                "content": result
+            })
+        return tool_results
+
     def run(self, context: Dict[str, Any], continue_from_checkpoint: bool = False) -> AgentResult:
         """
         执行Agent任务
@@ -521,6 +1189,7 @@ class BaseAgent(ABC):
             continue_from_checkpoint: 是否从checkpoint恢复（使用已保存的对话历史）
         """
         system_prompt = self.get_system_prompt(context)
+        system_blocks = self._build_system_blocks(system_prompt)
         tool_definitions = self._get_tool_definitions()
 
         # 缓存system_prompt和context（供manual_compact使用）
@@ -539,10 +1208,13 @@ class BaseAgent(ABC):
             logger.info(f"=== {self.__class__.__name__} 启动 ===")
             logger.debug(f"System Prompt:\n{system_prompt}")
 
+        self._last_known_tokens = None
+        self._compacted_at_tokens = None
+
         # Step 2: 构建并追加新的用户消息（永远都要做，不管是新对话还是继续）
         new_user_message = self.build_initial_message(context)
         if new_user_message:  # 如果有新消息，追加
-            raw_messages.append({"role": "user", "content": new_user_message})
+            self._append_message(raw_messages, {"role": "user", "content": new_user_message})
             logger.info(f"追加新用户消息: {new_user_message[:100]}...")
             logger.debug(f"完整用户消息:\n{new_user_message}")
 
@@ -551,48 +1223,75 @@ class BaseAgent(ABC):
         for iteration in range(self.max_iterations):
             _console.print(f"[{self.__class__.__name__}] Step {iteration + 1}", style="bold")
 
+            # 后台压缩已完成则替换history前缀
+            compacted = self._swap_in_background_compaction(raw_messages)
+            swapped = compacted is not raw_messages
+            if swapped:
+                raw_messages = compacted
+                self._conversation_history = raw_messages
+
             # 构建发送给API的messages（应用拼接策略）
             api_messages = self._build_messages_for_api(raw_messages)
+            total_tokens = self._estimate_context_tokens(api_messages, system_prompt)
+            if swapped:
+                self._compacted_at_tokens = total_tokens
+
+            # 超过阈值时后台压缩还没完成，先等待它
+            if total_tokens > self.context_config.compact_threshold and self._compaction_future is not None:
+                compacted = self._swap_in_background_compaction(raw_messages, wait=True)
+                if compacted is not raw_messages:
+                    raw_messages = compacted
+                    self._conversation_history = raw_messages
+                    api_messages = self._build_messages_for_api(raw_messages)
+                    total_tokens = self._estimate_context_tokens(api_messages, system_prompt)
+                    self._compacted_at_tokens = total_tokens
 
             # 检查是否需要Compact
-            if self._should_compact(api_messages, system_prompt):
+            if total_tokens > self.context_config.compact_threshold:
                 logger.info(f"触发Compact压缩前: {len(raw_messages)} 条messages")
-                logger.debug(f"压缩前messages概览: {self._format_messages_summary(raw_messages)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"压缩前messages概览: {self._format_messages_summary(raw_messages)}")
 
-                raw_messages = self._compact_messages(raw_messages, system_prompt)
+                raw_messages, new_tokens = self._compact_messages(raw_messages, system_prompt)
+                self._last_known_tokens = self._system_prompt_token_count(system_prompt) + new_tokens
+                self._compacted_at_tokens = self._last_known_tokens
+                self._conversation_history = raw_messages
                 api_messages = self._build_messages_for_api(raw_messages)
 
                 logger.info(f"Compact压缩后: {len(raw_messages)} 条messages")
-                logger.debug(f"压缩后messages概览: {self._format_messages_summary(raw_messages)}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"压缩后messages概览: {self._format_messages_summary(raw_messages)}")
+            else:
+                self._maybe_start_background_compaction(raw_messages, system_prompt, total_tokens)
 
-            # 打印发送给API的messages概览
-            logger.debug(f"发送给API的messages: {len(api_messages)} 条")
-            logger.debug(f"API messages概览: {self._format_messages_summary(api_messages)}")
+            # 打印发送给API的messages概览（非DEBUG级别时跳过，避免无用的字符串构建）
+            debug_enabled = logger.isEnabledFor(logging.DEBUG)
+            if debug_enabled:
+                logger.debug(f"发送给API的messages: {len(api_messages)} 条")
+                logger.debug(f"API messages概览: {self._format_messages_summary(api_messages)}")
 
-            # 调用Claude
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=32768,  # 32K - 平衡长度和响应时间
-                system=system_prompt,
-                tools=tool_definitions if tool_definitions else None,
-                messages=api_messages
-            )
+            # 调用Claude（流式，只读工具的tool_use块一结束就开始执行）
+            response, dispatched = self._stream_response(system_blocks, tool_definitions, api_messages)
 
             # 日志：记录响应
-            logger.debug(f"Response stop_reason: {response.stop_reason}")
-            for block in response.content:
-                if hasattr(block, "text"):
-                    logger.debug(f"Response text: {block.text[:500]}...")
-                    # 打印到 terminal，让用户看到 Agent 思考过程
-                    if block.text.strip():
-                        # Agent 思考文本用淡色显示（完整输出，不截断）
-                        _console.print(f"  {block.text}", style="dim", overflow="ignore", no_wrap=False, crop=False)
-                elif block.type == "tool_use":
-                    logger.debug(f"Tool call: {block.name}({json.dumps(block.input, ensure_ascii=False)[:200]}...)")
+            if debug_enabled:
+                logger.debug(f"Response stop_reason: {response.stop_reason}")
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    logger.debug(
+                        f"Prompt cache: read={getattr(usage, 'cache_read_input_tokens', None)}, "
+                        f"created={getattr(usage, 'cache_creation_input_tokens', None)}, "
+                        f"uncached_input={getattr(usage, 'input_tokens', None)}"
+                    )
+                for block in response.content:
+                    if hasattr(block, "text"):
+                        logger.debug(f"Response text: {block.text[:500]}...")
+                    elif block.type == "tool_use":
+                        logger.debug(f"Tool call: {block.name}({_preview_input(block.input, 200)})")
 
             # 保存assistant响应到raw_messages
             assistant_message = {"role": "assistant", "content": response.content}
-            raw_messages.append(assistant_message)
+            self._append_message(raw_messages, assistant_message)
 
             # 检查停止原因
             if response.stop_reason == "end_turn":
@@ -606,7 +1305,7 @@ class BaseAgent(ABC):
                 result = self.extract_result(text_content, context)
 
                 # 保存对话历史（用于checkpoint）
-                self._conversation_history = raw_messages.copy()
+                self._conversation_history = raw_messages
 
                 return result if result else AgentResult(
                     status="completed",
@@ -615,27 +1314,13 @@ class BaseAgent(ABC):
 
             elif response.stop_reason == "tool_use":
                 # 处理工具调用
-                tool_results = []
-                for block in response.content:
-                    if block.type == "tool_use":
-                        # 格式化参数显示
-                        params_str = json.dumps(block.input, ensure_ascii=False, indent=None)
-                        if len(params_str) > 100:
-                            params_str = params_str[:100] + "..."
-                        _console.print(f"  调用工具: [cyan]{block.name}[/cyan]({params_str})")
-
-                        result = self._handle_tool_call(block.name, block.input)
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": block.id,
-                            "content": result
-                        })
+                tool_results = self._collect_tool_results(response, dispatched)
 
                 # 保存工具结果到raw_messages
-                raw_messages.append({"role": "user", "content": tool_results})
+                self._append_message(raw_messages, {"role": "user", "content": tool_results})
 
                 # 立即更新对话历史（在触发checkpoint前）
-                self._conversation_history = raw_messages.copy()
+                self._conversation_history = raw_messages
 
                 # 🔥 Hook点：子类可在此注入自定义逻辑（如格式验证）
                 self._after_tool_execution(response, raw_messages)
@@ -646,52 +1331,54 @@ class BaseAgent(ABC):
 
             elif response.stop_reason == "max_tokens":
                 # max_tokens: 模型输出被截断
-                _console.print(f"  [继续] 输出被截断，继续生成...", style="yellow")
+                _console.print("  [继续] 输出被截断，继续生成...", style="yellow")
 
-                # 检查截断的响应中是否有 tool_use
-                # 如果有，必须先处理它们并返回 tool_result，否则 API 会报错
-                has_tool_use = any(
-                    block.type == "tool_use" for block in response.content
-                )
+                # 截断的响应中如果有 tool_use，必须先处理它们并返回 tool_result，否则 API 会报错
+                # （收集结果时顺带判断，不单独扫描一遍content）
+                tool_results = self._collect_tool_results(response, dispatched)
 
-                if has_tool_use:
-                    # 有 tool_use，先处理工具调用
-                    tool_results = []
-                    for block in response.content:
-                        if block.type == "tool_use":
-                            params_str = json.dumps(block.input, ensure_ascii=False, indent=None)
-                            if len(params_str) > 100:
-                                params_str = params_str[:100] + "..."
-                            _console.print(f"  调用工具: [cyan]{block.name}[/cyan]({params_str})")
-
-                            result = self._handle_tool_call(block.name, block.input)
-                            tool_results.append({
-                                "type": "tool_result",
-                                "tool_use_id": block.id,
-                                "content": result
-                            })
-
-                    # 保存工具结果，然后继续
-                    raw_messages.append({"role": "user", "content": tool_results})
+                if tool_results:
+                    # 有 tool_use，保存工具结果，然后继续
+                    self._append_message(raw_messages, {"role": "user", "content": tool_results})
 
                     # 立即更新对话历史（在触发checkpoint前）
-                    self._conversation_history = raw_messages.copy()
+                    self._conversation_history = raw_messages
 
                     # 触发checkpoint保存回调
                     if self.on_tool_call_complete:
                         self.on_tool_call_complete()
                 else:
                     # 没有 tool_use，直接添加继续提示
-                    raw_messages.append({"role": "user", "content": "请继续"})
+                    self._append_message(raw_messages, {"role": "user", "content": "请继续"})
 
             else:
                 _console.print(f"[警告] 未知的停止原因: {response.stop_reason}", style="yellow")
                 break
 
         # 达到最大step数 - 保存对话历史（用于checkpoint）
-        self._conversation_history = raw_messages.copy()
+        self._conversation_history = raw_messages
 
         return AgentResult(
             status="failed",
             message=f"达到最大step数 {self.max_iterations}"
         )
+
+    async def run_async(self, context: Dict[str, Any], continue_from_checkpoint: bool = False) -> AgentResult:
+        """
+        run() 的异步入口：在线程中执行同步的agentic loop
+
+        API请求和工具I/O在等待时都会释放GIL，多个Agent可以通过 asyncio.gather 并发运行
+        （它们共享同一个客户端连接池）。同一个Agent实例并发调用时抛出RuntimeError；
+        ask_human会在该线程中等待输入，并发运行多个Agent时应注入非交互的handler。
+        """
+        if not self._async_run_lock.acquire(blocking=False):
+            raise RuntimeError(f"{self.__class__.__name__} 实例正在运行，不能并发调用run_async")
+        try:
+            return await asyncio.to_thread(self.run, context, continue_from_checkpoint)
+        finally:
+            self._async_run_lock.release()
+
+    def close(self):
+        """结束工具执行和后台Compact线程（同一个Agent的多次run共用这些线程，不再使用Agent时调用）"""
+        for executor in (self._tool_executor, self._read_tool_executor, self._compactor):
+            executor.shutdown(wait=True, cancel_futures=True)
@@ -8,17 +8,468 @@ Scenario Builder Agent - 负责场景实现、样本合成、评测执行和失
 - Step 4: 评测执行 (benchkit)
 - Step 5: 失败分析 (analysis/, 可选)
 
-工具集：file_reader, file_writer, file_editor, bash, use_skill
+工具集：file_reader, file_writer, file_editor, bash, fetch_observation, use_skill
 使用独立tools模块实现
 """
-import json
+import hashlib
+import os
+import re
 import shutil
+import string
+import threading
+from concurrent.futures import Future
+from functools import lru_cache
 from pathlib import Path
 from typing import Dict, Any, Optional, List
 
-from .base_agent import BaseAgent, AgentResult, Tool, ContextConfig
-from tools import FileReader, FileWriter, FileEditor, BashExecutor, UseSkill, AskHuman
-from tools.validate_sample_format import validate_jsonl_file
+try:
+    import fcntl
+except ImportError:  # Windows没有fcntl，只能逐字节拷贝
+    fcntl = None
+
+from .base_agent import BaseAgent, AgentResult, Tool, ContextConfig, _console, _dumps
+from tools import FileReader, FileWriter, FileEditor, BashExecutor, PersistentBash, UseSkill, AskHuman, ObservationStore
+from tools.validate_sample_format import IncrementalJsonlValidator
+
+
+# benchkit克隆：指纹文件名 / 不拷贝的内容
+_BENCHKIT_REV_FILE = ".rev"
+_BENCHKIT_IGNORE = ("__pycache__", "*.pyc", _BENCHKIT_REV_FILE)
+
+# Linux FICLONE ioctl（reflink：目标文件与源文件共享数据块，写时复制）
+_FICLONE = 0x40049409
+
+
+def _raise_walk_error(error: OSError):
+    raise error
+
+
+@lru_cache(maxsize=None)
+def _tree_fingerprint(root: Path) -> str:
+    """
+    按 (相对路径, 大小, mtime) 计算目录树指纹（root不存在时抛出FileNotFoundError）
+
+    每个进程每个目录只遍历一次：源benchkit在运行期间不会变化，切换场景时直接复用
+    """
+    digest = hashlib.sha256()
+    entries = []
+    for dirpath, dirnames, filenames in os.walk(root, onerror=_raise_walk_error):
+        dirnames[:] = [d for d in dirnames if d not in _BENCHKIT_IGNORE]
+        for filename in filenames:
+            if filename == _BENCHKIT_REV_FILE or filename.endswith(".pyc"):
+                continue
+            path = os.path.join(dirpath, filename)
+            stat = os.stat(path)
+            entries.append((os.path.relpath(path, root), stat.st_size, stat.st_mtime_ns))
+    for entry in sorted(entries):
+        digest.update(repr(entry).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _clone_file(src: str, dst: str) -> str:
+    """
+    克隆单个文件：优先reflink，不支持时退回shutil.copy2
+
+    不使用硬链接：场景中的benchkit可能被原地修改，硬链接会连带改坏源benchkit
+    """
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as src_file, open(dst, "wb") as dst_file:
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except OSError:
+            pass  # 文件系统不支持reflink（如ext4、跨设备），下面按字节拷贝
+    return shutil.copy2(src, dst)
+
+
+def _refresh_file_func(synced_at_ns: int):
+    """
+    返回刷新已有benchkit时使用的copy_function
+
+    目标文件mtime晚于上次同步（.rev写入时间）说明场景中改过，保留不覆盖
+    """
+    def refresh_file(src: str, dst: str) -> str:
+        try:
+            if os.stat(dst).st_mtime_ns > synced_at_ns:
+                return dst
+        except FileNotFoundError:
+            pass
+        return _clone_file(src, dst)
+    return refresh_file
+
+
+# 工具的 input_schema（静态定义，所有Agent实例共享，不要原地修改）
+_TOOL_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    "file_reader": {
+        "type": "object",
+        "properties": {
+            "filename": {
+                "type": "string",
+                "description": "文件路径。可以使用：(1)绝对路径 (2)相对于场景目录的相对路径，如'unified_scenario_design.yaml'、'tools/xxx.py'"
+            },
+            "max_lines": {
+                "type": "integer",
+                "description": "最大读取行数，默认1000",
+                "default": 1000
+            }
+        },
+        "required": ["filename"]
+    },
+    "file_writer": {
+        "type": "object",
+        "properties": {
+            "filename": {
+                "type": "string",
+                "description": "文件路径，必须使用相对于场景目录的相对路径。例如：'tools/xxx.py'、'checkers/checker.py'、'samples/eval.jsonl'。不要包含场景目录名本身！"
+            },
+            "content": {
+                "type": "string",
+                "description": "文件内容"
+            },
+            "overwrite": {
+                "type": "boolean",
+                "description": "是否覆盖已有文件，默认true",
+                "default": True
+            }
+        },
+        "required": ["filename", "content"]
+    },
+    "file_editor": {
+        "type": "object",
+        "properties": {
+            "filename": {
+                "type": "string",
+                "description": "文件路径。可以使用：(1)绝对路径 (2)相对于场景目录的相对路径，如'tools/xxx.py'、'BusinessRules.md'"
+            },
+            "mode": {
+                "type": "string",
+                "enum": ["replace", "line_range"],
+                "description": "编辑模式"
+            },
+            "old_string": {
+                "type": "string",
+                "description": "replace模式：要替换的原字符串"
+            },
+            "new_string": {
+                "type": "string",
+                "description": "replace模式：替换后的新字符串"
+            },
+            "replace_all": {
+                "type": "boolean",
+                "description": "是否替换所有匹配项",
+                "default": False
+            },
+            "start_line": {
+                "type": "integer",
+                "description": "line_range模式：起始行号"
+            },
+            "end_line": {
+                "type": "integer",
+                "description": "line_range模式：结束行号"
+            },
+            "new_content": {
+                "type": "string",
+                "description": "line_range模式：替换内容"
+            }
+        },
+        "required": ["filename", "mode"]
+    },
+    "bash": {
+        "type": "object",
+        "properties": {
+            "command": {
+                "type": "string",
+                "description": "要执行的shell命令"
+            },
+            "timeout": {
+                "type": "integer",
+                "description": "超时时间（秒），默认120",
+                "default": 120
+            }
+        },
+        "required": ["command"]
+    },
+    "fetch_observation": {
+        "type": "object",
+        "properties": {
+            "ref": {
+                "type": "string",
+                "description": "归档引用，如工具结果中的 stdout_ref: 'obs://...'"
+            },
+            "offset": {
+                "type": "integer",
+                "description": "起始字符位置，默认0",
+                "default": 0
+            },
+            "limit": {
+                "type": "integer",
+                "description": "最多返回的字符数，默认20000",
+                "default": 20000
+            }
+        },
+        "required": ["ref"]
+    },
+    "use_skill": {
+        "type": "object",
+        "properties": {
+            "skill_type": {
+                "type": "string",
+                "enum": [
+                    "tool_implementation",
+                    "checker_implementation",
+                    "sample_authoring",
+                    "evaluation_execution",
+                    "failure_analysis",
+                    "execute_to_init_context",
+                    "business_rules_authoring",
+                    "scenario_design_sop"
+                ],
+                "description": "技能类型（见上方description中的完整列表）"
+            }
+        },
+        "required": ["skill_type"]
+    },
+    "ask_human": {
+        "type": "object",
+        "properties": {
+            "request": {
+                "type": "string",
+                "description": "向人提出的请求或问题"
+            },
+            "options": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "可选的预设选项"
+            }
+        },
+        "required": ["request"]
+    },
+    "request_layer1_fix": {
+        "type": "object",
+        "properties": {
+            "trigger_reason": {
+                "type": "string",
+                "description": "触发原因简述（1句话），如'Critical问题占比35%，超过30%阈值'"
+            },
+            "problem_details": {
+                "type": "string",
+                "description": "问题详细描述，说明具体发现了什么问题"
+            },
+            "modification_suggestions": {
+                "type": "array",
+                "items": {"type": "string"},
+                "description": "具体修改建议列表，每条建议应明确指出需要修改什么"
+            }
+        },
+        "required": ["trigger_reason", "modification_suggestions"]
+    }
+}
+
+
+# System prompt模板（模块加载时构建一次，只替换工作目录/场景目录）
+_BASE_PROMPT_TMPL = string.Template("""## 定位
+
+你是Execute Agent，负责合成高质量、高难度的Agent评测样本（Layer 2-3-4）。
+
+你有一个设计师伙伴**Init Agent**负责Layer 1设计工作（BusinessRules.md、unified_scenario_design.yaml等）。当你发现设计文件有问题时，使用`request_layer1_fix`工具请求Init Agent修改，不要自己改设计文件。
+
+**接收的Context**：
+- `design_artifacts["scenario_dir"]`: 场景目录（你的工作根目录）
+- `design_artifacts`: Init Agent的设计产物（场景名、各设计文件路径）
+- `user_requirement`: 用户原始需求
+- `iteration`: 当前迭代次数
+
+如果用户要求修改**设计文件本身**（BusinessRules.md、unified_scenario_design.yaml），这超出了你的职责。应该使用 `request_layer1_fix` 工具请求返回设计阶段，系统会自动切换回Init Agent进行设计修改。
+
+如果是修改**执行层面的代码**（tools/*.py、checkers/*.py、样本生成逻辑），这是你的职责，可以往下工作。
+
+## 目录结构约定
+
+你的工作目录是：`${working_dir}`
+
+关键文件位置（相对于工作目录）：
+- **设计文件**：`unified_scenario_design.yaml`
+- **业务规则**：`BusinessRules.md`
+- **样本文件**：`samples/eval.jsonl`
+- **Benchkit**：`benchkit/`（已自动拷贝）
+- **评测输出**：`evaluation_outputs/`
+
+执行 benchkit 命令时，确保在工作目录下执行，所有路径使用相对路径。
+
+## 核心目标
+
+**最终交付物**：高质量、高难度、有区分度的Agent评测样本集
+
+**关键原则**：
+- ✅ 样本质量和难度是核心目标
+- ✅ 评测是为了发现和修复**样本设计问题**和**系统问题**
+- ❌ **不追求高成功率** - 样本应该有难度，失败是正常的
+- ❌ **不降低难度来提高成功率** - 这完全背离目标
+
+## 评测结果的正确使用
+
+**评测的作用**：诊断问题，而非证明样本好
+
+当评测失败时，分析失败原因：
+1. **样本设计问题**：
+   - Checker配置不合理（过严/过松、临界值错误）
+   - BusinessRules描述模糊、矛盾
+   - Checklist与Query不一致
+   - 用户模拟器prompt设计不当
+   → **修复样本设计**
+
+2. **系统问题**：
+   - Tool实现有bug
+   - Checker逻辑错误
+   - Tool返回格式不符合规范
+   → **修复代码**
+
+3. **Agent能力问题**：
+   - Agent未遵循规则、信息收集不足、执行错误等
+   → **这是正常的评测结果，保留样本**
+
+**错误做法示例**：
+- ❌ "成功率只有60%，我要简化样本来提高成功率"
+- ❌ "太多失败了，我要放宽checker条件"
+- ✅ "成功率60%，分析失败原因：3个样本设计问题已修复，5个是Agent能力问题（符合预期）"
+
+## 完成条件
+
+任务完成的判断标准：
+1. **样本质量合格**：无样本设计缺陷、无系统bug
+2. **难度和覆盖面达标**：有效测试目标能力、有足够区分度
+3. **数量充足**：达到预期样本数量
+
+**不是**"成功率>=85%"！成功率取决于被测模型能力和样本难度。
+
+**完成后的行为**：使用`ask_human`工具汇报完成情况（哪些层完成、样本数量、评测结果），请求人工确认是否满意或需要进一步优化。
+
+## 执行流程（Layer 2-4）
+
+**必须按顺序完成以下步骤**：
+
+### Layer 2: 组件代码生成
+1. **生成tools/** - 根据unified_scenario_design.yaml中的tools定义实现MCP工具
+2. **生成checkers/** - 根据checkers定义实现验证逻辑
+3. **生成data_pools/** - 根据entities定义创建测试数据（JSONL格式）
+   - ⚠️ **必须生成**，即使场景初始状态为空也要创建目录结构
+   - 每个entity对应一个`data_pools/{entity}.jsonl`文件
+   - 数据要覆盖所有筛选条件组合，确保样本生成时能匹配到数据
+4. 运行单元测试验证组件正确性（可选）
+
+### Layer 3: 样本合成
+5. **生成样本生成器** - 基于data_pools、user_need_templates实现
+6. **运行生成器** - 产出`samples/eval.jsonl`
+   - ⚠️ **样本格式必须严格遵循规范**：`.claude/skills/sample_authoring/references/sample_format_spec.json`
+   - 必需字段：data_id, query, system, servers, environment, check_list
+   - 在实现生成器前，**必须先用file_reader读取sample_format_spec.json**了解格式
+7. 验证样本格式和质量
+
+### Layer 4: 评测与迭代
+8. 运行小规模评测（5-10个样本）
+9. 分析失败原因（样本问题/系统问题/Agent能力问题）
+10. 修复样本设计问题和系统bug
+11. （可选）运行完整评测并生成报告
+
+## 交付物（使用相对路径）
+
+**重要**：所有文件路径必须是相对于场景目录的相对路径，不要包含场景目录本身！
+
+正确写法：
+- tools/xxx.py
+- checkers/checker.py
+- data_pools/xxx.jsonl
+- samples/eval.jsonl
+
+错误写法（绝对不要这样）：
+- outputs/场景名/tools/xxx.py  ← 错误！会导致嵌套
+- /Users/.../tools/xxx.py     ← 错误！
+
+目录结构：
+```
+<场景目录>/           # file_writer 的 base_dir，不需要写这部分
+├── tools/           # 写 "tools/xxx.py"
+├── checkers/        # 写 "checkers/checker.py"
+├── data_pools/      # 写 "data_pools/xxx.jsonl"
+├── samples/         # 写 "samples/eval.jsonl"
+└── execution_outputs/
+```
+
+## 禁止行为
+
+- ❌ 创建冗余的"完成报告"、"状态总结"、"使用指南"等markdown文档（如COMPLETION_REPORT.md、FINAL_STATUS.md、QUICK_START.md）
+- ❌ 创建额外的测试样本文件（如test_5.jsonl、test_sample.jsonl），应直接使用samples/eval.jsonl配合executor的--limit参数
+- ❌ 反复展示样本内容、统计信息、验证结果
+- ❌ 在达到完成条件后继续创建文档或执行操作，应立即调用`ask_human`请求确认
+
+## 可用技能
+
+通过use_skill工具获取参考资源（详细列表见工具描述）：
+- **scenario_design_sop**: 五种难度提升方法（复杂规则、领域知识、多轮变更等）
+- **tool_implementation**: 工具实现模板和示例
+- **checker_implementation**: Checker实现指南
+- **sample_authoring**: 样本合成SOP（质量标准、格式规范）
+- **evaluation_execution**: 评测执行指南（benchkit使用）
+- **failure_analysis**: 失败案例归因分析（区分样本问题/系统问题/Agent能力问题）
+""")
+
+# 有场景目录时追加的场景配置信息
+_CONFIG_SECTION_TMPL = string.Template("""
+
+## 工作环境
+
+**场景目录**: ${scenario_dir}
+
+**所有工具的工作目录**: 场景目录（${scenario_dir}）
+- file_reader/file_writer/file_editor: 相对路径基于场景目录
+- bash: 工作目录就是场景目录；输出过长时只返回首尾预览和stdout_ref，需要完整内容时用fetch_observation读取
+- 例如: file_reader("tools/xxx.py") 读取 ${scenario_dir}/tools/xxx.py
+- 例如: bash("python benchkit/executor.py ...") 在 ${scenario_dir} 下执行
+
+**benchkit位置**: ${scenario_dir}/benchkit/
+- 系统已自动将benchkit拷贝到场景目录
+- 配置文件: benchkit/model_config.json
+- 执行器: benchkit/executor.py
+
+## ⚠️ Benchkit使用规范（重要）
+
+**关键原则**：Benchkit是黑盒评测工具，遇到问题时**不要深入debug，立即ask_human**
+
+**正确使用方式**：
+1. **必须使用** `use_skill(skill_type="evaluation_execution")` 获取正确的使用指南
+2. **严格按照skill文档中的命令执行**，不要自行修改路径或参数
+
+**🚨 强制规则：3次失败必须停止**
+
+执行benchkit命令时，如果遇到错误：
+- **第1次失败**：检查命令拼写、参数是否完整
+- **第2次失败**：检查配置文件benchkit/model_config.json是否存在
+- **第3次失败**：**立即调用ask_human**，提供完整的命令、错误信息、已尝试的方案
+
+**绝对禁止**：
+- ❌ 连续尝试5次以上不同的命令变体
+- ❌ 阅读benchkit源码试图理解内部实现
+- ❌ 修改benchkit源代码或配置来"修复"问题
+- ❌ 发明benchkit不支持的CLI参数（如--model-config）
+- ❌ 在场景目录下创建benchkit/model_config.json副本
+
+**遇到以下情况立即ask_human**：
+- 连续3次出现 `required arguments` 错误
+- 出现 `API connection error` 或 `401 Unauthorized`
+- 找不到 `benchkit/model_config.json`
+- MCP服务器启动失败
+- executor.py的`--help`输出与skill文档不符
+""")
+
+
+@lru_cache(maxsize=16)
+def _render_system_prompt(working_dir: str, scenario_dir: Optional[str]) -> str:
+    """渲染system prompt（相同目录直接复用已渲染的结果）"""
+    base_prompt = _BASE_PROMPT_TMPL.substitute(working_dir=working_dir)
+    if scenario_dir:
+        return base_prompt + _CONFIG_SECTION_TMPL.substitute(scenario_dir=scenario_dir)
+    return base_prompt
 
 
 class ScenarioBuilderAgent(BaseAgent):
@@ -46,6 +497,37 @@ class ScenarioBuilderAgent(BaseAgent):
         keep_recent_steps=3         # 减少保留步数，防止最近几步本身就过大
     )
 
+    # 只读工具，相邻调用可并发执行（见 BaseAgent._stream_response）
+    _READ_ONLY_TOOLS = frozenset({"file_reader", "use_skill", "fetch_observation"})
+
+    # 固定的错误返回（预先序列化，直接返回）
+    _ERR_WRITER_NOT_READY = _dumps({"error": "未设置scenario_dir，请先读取设计文件"})
+    _ERR_EDITOR_NOT_READY = _dumps({"error": "未设置scenario_dir"})
+    _ERR_OBSERVATIONS_NOT_READY = _dumps({"error": "未设置scenario_dir，当前没有已归档的工具输出"})
+    # request_layer1_fix的返回只有trigger_reason是变化的，固定部分预先序列化（去掉结尾的"}"）
+    _LAYER1_FIX_PREFIX = _dumps({
+        "success": True,
+        "action": "return_to_init",
+        "message": "已设置返回Init Agent标志，系统将在本轮结束后切换回设计阶段"
+    })[:-1]
+
+    # bash输出超过该长度（字符）时归档，上下文中只保留首尾预览 + obs://引用
+    OBSERVATION_STASH_CHARS = 4000
+    OBSERVATION_PREVIEW_CHARS = 1500
+
+    # 样本格式反馈中展示的错误条数
+    SAMPLE_ERROR_DISPLAY_LIMIT = 5
+
+    # 样本格式不合规时注入的提醒（只填充错误摘要和详情）
+    _SAMPLE_FORMAT_REMINDER = """⚠️  刚才写入的样本文件 samples/eval.jsonl 格式验证未通过！
+
+{error_summary}
+
+详细错误：
+{error_details}
+
+请读取 .claude/skills/sample_authoring/references/sample_format_spec.json 了解正确格式，然后修正生成器或直接编辑样本文件。"""
+
     def __init__(
         self,
         skills_dir: str = ".claude/skills",
@@ -63,12 +545,26 @@ class ScenarioBuilderAgent(BaseAgent):
         self._file_reader: Optional[FileReader] = None
         self._file_writer: Optional[FileWriter] = None
         self._file_editor: Optional[FileEditor] = None
-        self._bash: Optional[BashExecutor] = None
+        self._bash: Optional[PersistentBash] = None
+        self._observations: Optional[ObservationStore] = None
         self._use_skill = UseSkill(skills_dir=self.skills_dir)
         self._ask_human = AskHuman()  # 可由 Orchestrator 注入自定义 handler
 
         # 样本格式验证状态标志
         self._samples_validation_reminded = False
+        # 上次验证时样本文件的 mtime（未变化时复用验证结果）
+        self._last_validated_mtime: Optional[int] = None
+        self._last_validation_result: Optional[Dict[str, Any]] = None
+        # 样本文件增量验证（只解析上次验证后新增的行）
+        self._sample_validator = IncrementalJsonlValidator()
+
+        self._prefix_strip_re: Optional[re.Pattern] = None
+
+        # 场景根目录查找缓存: 目录 -> 场景根目录（None表示向上找不到）
+        self._scenario_root_cache: Dict[Path, Optional[Path]] = {}
+        # file_reader在只读工具线程池中并发执行，由它触发的场景初始化需要互斥
+        self._scenario_init_lock = threading.Lock()
+        self._execution_output_dir: Optional[Path] = None
 
         # 定义工具
         tools = self._create_tools()
@@ -82,28 +578,79 @@ class ScenarioBuilderAgent(BaseAgent):
         )
 
     def _setup_benchkit_for_scenario(self, scenario_dir: Path):
-        """拷贝benchkit到场景目录"""
-        target_benchkit = scenario_dir / "benchkit"
+        """
+        拷贝benchkit到场景目录
 
-        if target_benchkit.exists():
-            return  # 已存在，跳过
+        目标目录中记录源benchkit指纹（.rev），指纹一致时跳过；源benchkit有更新时刷新，
+        但上次同步后在场景中改过的文件保留不覆盖。文件优先用reflink克隆（写时复制，不搬运数据），文件系统不支持时再逐字节拷贝。
+        """
+        target_benchkit = scenario_dir / "benchkit"
 
         # 源benchkit路径：auto_synthesis_system/benchkit
         source_benchkit = Path(__file__).parent.parent / "benchkit"
 
-        if not source_benchkit.exists():
-            raise FileNotFoundError(f"源benchkit不存在: {source_benchkit}")
-
-        # 直接拷贝整个目录
-        shutil.copytree(source_benchkit, target_benchkit)
+        # 源目录是否存在由遍历本身判断，不单独探测
+        try:
+            fingerprint = _tree_fingerprint(source_benchkit)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"源benchkit不存在: {source_benchkit}") from None
+
+        # .rev 即就绪标记：能读到且指纹一致说明已是最新，跳过
+        rev_file = target_benchkit / _BENCHKIT_REV_FILE
+        try:
+            current = rev_file.read_text(encoding="utf-8")
+            synced_at_ns = rev_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            current = None
+            synced_at_ns = None
+        if current == fingerprint:
+            return
+
+        # 不存在则克隆；已存在但指纹不一致则刷新源文件（保留场景目录中新增和改过的文件）
+        refresh = current is not None or target_benchkit.exists()
+        if refresh and synced_at_ns is None:
+            # .rev 出现之前拷贝的benchkit：不知道上次同步时间，已有文件都视为改过，只补齐缺失的文件
+            synced_at_ns = -1
+        if synced_at_ns is not None:
+            copy_function = _refresh_file_func(synced_at_ns)
+        else:
+            copy_function = _clone_file
+        shutil.copytree(
+            source_benchkit,
+            target_benchkit,
+            copy_function=copy_function,
+            ignore=shutil.ignore_patterns(*_BENCHKIT_IGNORE),
+            dirs_exist_ok=True
+        )
+        rev_file.write_text(fingerprint, encoding="utf-8")
 
-        from .base_agent import _console
-        _console.print(f"  ✓ 已拷贝benchkit到场景目录", style="green")
+        if refresh:
+            _console.print(f"  ✓ 已更新场景目录中的benchkit", style="green")
+        else:
+            _console.print(f"  ✓ 已拷贝benchkit到场景目录", style="green")
 
     def _init_tools_for_scenario(self, scenario_dir: Path):
         """为场景初始化工具"""
         self.scenario_dir = scenario_dir
 
+        # file_writer路径中需要去除的嵌套前缀（按顺序匹配第一个）
+        scenario_name = re.escape(scenario_dir.name)
+        self._prefix_strip_re = re.compile(
+            rf"^(?:outputs/{scenario_name}/|{scenario_name}/|{re.escape(str(scenario_dir))}/)"
+        )
+
+        # 旧场景尚未落盘的写入先落盘；常驻bash只在工作目录变化时重启
+        if self._file_writer is not None:
+            self._file_writer.flush()
+        if self._bash is not None and self._bash.work_dir != scenario_dir:
+            self._bash.close()
+            self._bash = None
+
+        # 样本验证状态属于旧场景
+        self._sample_validator.reset()
+        self._last_validated_mtime = None
+        self._last_validation_result = None
+
         # 1. 确保benchkit已拷贝到场景目录
         self._setup_benchkit_for_scenario(scenario_dir)
 
@@ -112,11 +659,46 @@ class ScenarioBuilderAgent(BaseAgent):
         self._file_reader = FileReader(base_dir=scenario_dir)
         self._file_writer = FileWriter(base_dir=scenario_dir)
         self._file_editor = FileEditor(base_dir=scenario_dir)
-        self._bash = BashExecutor(work_dir=scenario_dir)
+        if self._bash is None:
+            self._bash = PersistentBash(work_dir=scenario_dir)
+        self._observations = ObservationStore(base_dir=scenario_dir / "execution_outputs" / "observations")
+
+        # 3. execution_outputs目录在第一次可能写入时再创建（见 _ensure_execution_output_dir）
+        self._execution_output_dir: Optional[Path] = None
+
+    def _ensure_execution_output_dir(self) -> Path:
+        """返回当前迭代的execution_outputs目录，首次调用时创建"""
+        execution_output_dir = self.scenario_dir / "execution_outputs" / f"iteration_{self.current_iteration}"
+        if self._execution_output_dir != execution_output_dir:
+            execution_output_dir.mkdir(parents=True, exist_ok=True)
+            self._execution_output_dir = execution_output_dir
+        return execution_output_dir
+
+    def _find_scenario_root(self, directory: Path) -> Optional[Path]:
+        """
+        从directory向上查找包含unified_scenario_design.yaml的场景根目录
 
-        # 3. 创建execution_outputs目录用于记录（如果需要）
-        execution_output_dir = scenario_dir / "execution_outputs" / f"iteration_{self.current_iteration}"
-        execution_output_dir.mkdir(parents=True, exist_ok=True)
+        每个目录只scandir一次，结果（包括未找到）按目录缓存
+        """
+        visited = []
+        root = None
+        for candidate in (directory, *directory.parents):
+            if candidate in self._scenario_root_cache:
+                root = self._scenario_root_cache[candidate]
+                break
+            visited.append(candidate)
+            try:
+                with os.scandir(candidate) as entries:
+                    names = {entry.name for entry in entries}
+            except OSError:
+                continue
+            if "unified_scenario_design.yaml" in names:
+                root = candidate
+                break
+
+        for candidate in visited:
+            self._scenario_root_cache[candidate] = root
+        return root
 
     def _create_tools(self) -> List[Tool]:
         """创建Execute Agent的工具集"""
@@ -124,183 +706,84 @@ class ScenarioBuilderAgent(BaseAgent):
             Tool(
                 name="file_reader",
                 description="读取文件内容，支持Text、JSON、Python、Markdown等格式",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "filename": {
-                            "type": "string",
-                            "description": "文件路径。可以使用：(1)绝对路径 (2)相对于场景目录的相对路径，如'unified_scenario_design.yaml'、'tools/xxx.py'"
-                        },
-                        "max_lines": {
-                            "type": "integer",
-                            "description": "最大读取行数，默认1000",
-                            "default": 1000
-                        }
-                    },
-                    "required": ["filename"]
-                },
+                input_schema=_TOOL_SCHEMAS["file_reader"],
                 handler=self._handle_file_reader
             ),
             Tool(
                 name="file_writer",
                 description="创建新文件或覆盖已有文件（如tools/*.py, checkers/*.py, samples/*.json）",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "filename": {
-                            "type": "string",
-                            "description": "文件路径，必须使用相对于场景目录的相对路径。例如：'tools/xxx.py'、'checkers/checker.py'、'samples/eval.jsonl'。不要包含场景目录名本身！"
-                        },
-                        "content": {
-                            "type": "string",
-                            "description": "文件内容"
-                        },
-                        "overwrite": {
-                            "type": "boolean",
-                            "description": "是否覆盖已有文件，默认true",
-                            "default": True
-                        }
-                    },
-                    "required": ["filename", "content"]
-                },
+                input_schema=_TOOL_SCHEMAS["file_writer"],
                 handler=self._handle_file_writer
             ),
             Tool(
                 name="file_editor",
                 description="编辑已有文件，支持精确字符串替换和行范围编辑",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "filename": {
-                            "type": "string",
-                            "description": "文件路径。可以使用：(1)绝对路径 (2)相对于场景目录的相对路径，如'tools/xxx.py'、'BusinessRules.md'"
-                        },
-                        "mode": {
-                            "type": "string",
-                            "enum": ["replace", "line_range"],
-                            "description": "编辑模式"
-                        },
-                        "old_string": {
-                            "type": "string",
-                            "description": "replace模式：要替换的原字符串"
-                        },
-                        "new_string": {
-                            "type": "string",
-                            "description": "replace模式：替换后的新字符串"
-                        },
-                        "replace_all": {
-                            "type": "boolean",
-                            "description": "是否替换所有匹配项",
-                            "default": False
-                        },
-                        "start_line": {
-                            "type": "integer",
-                            "description": "line_range模式：起始行号"
-                        },
-                        "end_line": {
-                            "type": "integer",
-                            "description": "line_range模式：结束行号"
-                        },
-                        "new_content": {
-                            "type": "string",
-                            "description": "line_range模式：替换内容"
-                        }
-                    },
-                    "required": ["filename", "mode"]
-                },
+                input_schema=_TOOL_SCHEMAS["file_editor"],
                 handler=self._handle_file_editor
             ),
             Tool(
                 name="bash",
                 description="执行shell命令（安全受限），用于运行测试、评测脚本等",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "command": {
-                            "type": "string",
-                            "description": "要执行的shell命令"
-                        },
-                        "timeout": {
-                            "type": "integer",
-                            "description": "超时时间（秒），默认120",
-                            "default": 120
-                        }
-                    },
-                    "required": ["command"]
-                },
+                input_schema=_TOOL_SCHEMAS["bash"],
                 handler=self._handle_bash
             ),
+            Tool(
+                name="fetch_observation",
+                description=ObservationStore.description,
+                input_schema=_TOOL_SCHEMAS["fetch_observation"],
+                handler=self._handle_fetch_observation
+            ),
             Tool(
                 name="use_skill",
                 description=self._use_skill.description,  # 使用UseSkill类的详细描述
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "skill_type": {
-                            "type": "string",
-                            "enum": [
-                                "tool_implementation",
-                                "checker_implementation",
-                                "sample_authoring",
-                                "evaluation_execution",
-                                "failure_analysis",
-                                "execute_to_init_context",
-                                "business_rules_authoring",
-                                "scenario_design_sop"
-                            ],
-                            "description": "技能类型（见上方description中的完整列表）"
-                        }
-                    },
-                    "required": ["skill_type"]
-                },
+                input_schema=_TOOL_SCHEMAS["use_skill"],
                 handler=self._handle_use_skill
             ),
             Tool(
                 name="ask_human",
                 description="请求人工介入。当需要人工审批、确认或补充信息时调用。",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "request": {
-                            "type": "string",
-                            "description": "向人提出的请求或问题"
-                        },
-                        "options": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "可选的预设选项"
-                        }
-                    },
-                    "required": ["request"]
-                },
+                input_schema=_TOOL_SCHEMAS["ask_human"],
                 handler=self._handle_ask_human
             ),
             Tool(
                 name="request_layer1_fix",
                 description="请求返回Init Agent进行设计修改。当发现问题需要修改设计文件（BusinessRules.md、unified_scenario_design.yaml等）时调用。",
-                input_schema={
-                    "type": "object",
-                    "properties": {
-                        "trigger_reason": {
-                            "type": "string",
-                            "description": "触发原因简述（1句话），如'Critical问题占比35%，超过30%阈值'"
-                        },
-                        "problem_details": {
-                            "type": "string",
-                            "description": "问题详细描述，说明具体发现了什么问题"
-                        },
-                        "modification_suggestions": {
-                            "type": "array",
-                            "items": {"type": "string"},
-                            "description": "具体修改建议列表，每条建议应明确指出需要修改什么"
-                        }
-                    },
-                    "required": ["trigger_reason", "modification_suggestions"]
-                },
+                input_schema=_TOOL_SCHEMAS["request_layer1_fix"],
                 handler=self._handle_request_layer1_fix
             )
         ]
 
+    def _handle_tool_call(self, tool_name: str, tool_input: Dict[str, Any]) -> str:
+        """处理工具调用（file_writer以外的工具都可能读取磁盘文件，执行前先落盘暂存的写入）"""
+        if tool_name != "file_writer" and self._file_writer is not None:
+            try:
+                self._file_writer.flush()
+            except OSError as e:
+                return _dumps({"error": str(e)})
+        return super()._handle_tool_call(tool_name, tool_input)
+
+    def _collect_tool_results(self, response, dispatched: Dict[str, Future]) -> List[Dict]:
+        """收集工具结果，本轮结束时落盘暂存的写入（之后的验证Hook、checkpoint都读磁盘）"""
+        try:
+            tool_results = super()._collect_tool_results(response, dispatched)
+        finally:
+            flush_error = self._flush_file_writer()
+        if flush_error:
+            # 写入在execute时已报告成功，落盘失败需要让模型知道
+            tool_results.append({"type": "text", "text": f"[file_writer] {flush_error}"})
+        return tool_results
+
+    def _flush_file_writer(self) -> Optional[str]:
+        """落盘暂存的写入，失败时返回错误信息"""
+        if self._file_writer is None:
+            return None
+        try:
+            self._file_writer.flush()
+        except OSError as e:
+            _console.print(f"  [file_writer] {e}", style="red")
+            return str(e)
+        return None
+
     # ========== 工具处理器 ==========
 
     def _handle_file_reader(self, filename: str, max_lines: int = 1000) -> str:
@@ -308,12 +791,12 @@ class ScenarioBuilderAgent(BaseAgent):
         path = Path(filename)
 
         # 如果是绝对路径，尝试从中推断scenario_dir
-        if path.is_absolute() and path.exists():
-            for parent in path.parents:
-                if (parent / "unified_scenario_design.yaml").exists():
+        if self.scenario_dir is None and path.is_absolute() and path.exists():
+            scenario_root = self._find_scenario_root(path.parent)
+            if scenario_root is not None:
+                with self._scenario_init_lock:
                     if self.scenario_dir is None:
-                        self._init_tools_for_scenario(parent)
-                    break
+                        self._init_tools_for_scenario(scenario_root)
 
         # 如果工具未初始化，使用临时reader
         if self._file_reader is None:
@@ -322,35 +805,25 @@ class ScenarioBuilderAgent(BaseAgent):
         else:
             result = self._file_reader.execute(filename=filename, max_lines=max_lines)
 
-        return json.dumps(result, ensure_ascii=False)
+        return _dumps(result)
 
     def _handle_file_writer(self, filename: str, content: str, overwrite: bool = True) -> str:
         """处理file_writer调用"""
         if self._file_writer is None:
-            return json.dumps({"error": "未设置scenario_dir，请先读取设计文件"})
+            return self._ERR_WRITER_NOT_READY
 
         # 自动修正嵌套路径问题
         # 如果 filename 包含 scenario_dir 的路径，自动去除
-        if self.scenario_dir:
-            scenario_name = self.scenario_dir.name
-            # 检查各种可能的嵌套模式
-            prefixes_to_strip = [
-                f"outputs/{scenario_name}/",
-                f"{scenario_name}/",
-                str(self.scenario_dir) + "/",
-            ]
-            for prefix in prefixes_to_strip:
-                if filename.startswith(prefix):
-                    filename = filename[len(prefix):]
-                    break
+        if self._prefix_strip_re is not None:
+            filename = self._prefix_strip_re.sub("", filename, count=1)
 
         result = self._file_writer.execute(filename=filename, content=content, overwrite=overwrite)
-        return json.dumps(result, ensure_ascii=False)
+        return _dumps(result)
 
     def _handle_file_editor(self, filename: str, mode: str, **kwargs) -> str:
         """处理file_editor调用"""
         if self._file_editor is None:
-            return json.dumps({"error": "未设置scenario_dir"})
+            return self._ERR_EDITOR_NOT_READY
 
         if mode == "replace":
             result = self._file_editor.execute_replace(
@@ -368,41 +841,73 @@ class ScenarioBuilderAgent(BaseAgent):
             )
         else:
             result = {"error": f"未知的编辑模式: {mode}"}
-        return json.dumps(result, ensure_ascii=False)
+        return _dumps(result)
 
     def _handle_bash(self, command: str, timeout: int = 120) -> str:
-        """处理bash调用，对输出做截断保护"""
+        """处理bash调用，对输出做截断保护（在读取时截断，超大输出不进入内存）"""
+        # 每个输出最多保留20K字节，防止超大输出导致context爆炸
+        MAX_OUTPUT_BYTES = 20000
+
         if self._bash is None:
             # 临时bash，工作目录为当前目录
-            temp_bash = BashExecutor(work_dir=Path.cwd(), timeout=timeout)
-            result = temp_bash.execute(command=command, timeout=timeout)
+            bash = BashExecutor(work_dir=Path.cwd(), timeout=timeout)
         else:
-            result = self._bash.execute(command=command, timeout=timeout)
-
-        # 对stdout/stderr做截断保护，防止超大输出导致context爆炸
-        MAX_OUTPUT_CHARS = 20000  # 每个输出最多保留20K字符
+            # 命令可能向execution_outputs写入（重定向等），执行前确保目录存在
+            self._ensure_execution_output_dir()
+            bash = self._bash
+        result = bash.execute(
+            command=command,
+            timeout=timeout,
+            max_stdout_bytes=MAX_OUTPUT_BYTES,
+            max_stderr_bytes=MAX_OUTPUT_BYTES
+        )
 
-        if result.get("stdout") and len(result["stdout"]) > MAX_OUTPUT_CHARS:
-            truncated_len = len(result["stdout"])
-            result["stdout"] = result["stdout"][:MAX_OUTPUT_CHARS] + f"\n\n... (输出被截断，原始长度: {truncated_len} 字符，仅显示前 {MAX_OUTPUT_CHARS} 字符)"
+        if result.get("stdout_dropped"):
+            total_len = MAX_OUTPUT_BYTES + result["stdout_dropped"]
+            result["stdout"] += f"\n\n... (输出被截断，原始长度: {total_len} 字节，仅显示前 {MAX_OUTPUT_BYTES} 字节)"
             result["truncated"] = True
 
-        if result.get("stderr") and len(result["stderr"]) > MAX_OUTPUT_CHARS:
-            truncated_len = len(result["stderr"])
-            result["stderr"] = result["stderr"][:MAX_OUTPUT_CHARS] + f"\n\n... (错误输出被截断，原始长度: {truncated_len} 字符)"
+        if result.get("stderr_dropped"):
+            total_len = MAX_OUTPUT_BYTES + result["stderr_dropped"]
+            result["stderr"] += f"\n\n... (错误输出被截断，原始长度: {total_len} 字节)"
             result["truncated"] = True
 
-        return json.dumps(result, ensure_ascii=False)
+        # 大段输出归档，上下文中只保留首尾预览
+        if self._observations is not None:
+            for key in ("stdout", "stderr"):
+                self._stash_observation(result, key)
+
+        return _dumps(result)
+
+    def _stash_observation(self, result: Dict[str, Any], key: str):
+        """将result[key]中的大段文本归档，替换为首尾预览，并记录 {key}_ref 引用"""
+        text = result.get(key)
+        if not text or len(text) <= self.OBSERVATION_STASH_CHARS:
+            return
+        preview = self.OBSERVATION_PREVIEW_CHARS
+        result[f"{key}_ref"] = self._observations.stash(text)
+        result[f"{key}_chars"] = len(text)
+        result[key] = (
+            text[:preview]
+            + f"\n\n... (中间 {len(text) - 2 * preview} 字符已归档，用fetch_observation读取 {result[f'{key}_ref']}) ...\n\n"
+            + text[-preview:]
+        )
+
+    def _handle_fetch_observation(self, ref: str, offset: int = 0, limit: int = 20000) -> str:
+        """处理fetch_observation调用"""
+        if self._observations is None:
+            return self._ERR_OBSERVATIONS_NOT_READY
+        return _dumps(self._observations.execute(ref=ref, offset=offset, limit=limit))
 
     def _handle_use_skill(self, skill_type: str) -> str:
         """处理use_skill调用"""
         result = self._use_skill.execute(skill_type=skill_type)
-        return json.dumps(result, ensure_ascii=False)
+        return _dumps(result)
 
     def _handle_ask_human(self, request: str, options: List[str] = None) -> str:
         """处理ask_human调用"""
         result = self._ask_human.execute(request=request, options=options)
-        return json.dumps(result, ensure_ascii=False)
+        return _dumps(result)
 
     def _handle_request_layer1_fix(self, trigger_reason: str, modification_suggestions: List[str], problem_details: str = "") -> str:
         """处理request_layer1_fix调用 - 请求返回Init Agent"""
@@ -412,227 +917,21 @@ class ScenarioBuilderAgent(BaseAgent):
             "trigger_reason": trigger_reason,
             "problem_details": problem_details,
             "modification_suggestions": modification_suggestions,
-            "execution_output_dir": str(self.scenario_dir / "execution_outputs" / f"iteration_{self.current_iteration}") if self.scenario_dir else ""
+            "execution_output_dir": str(self._ensure_execution_output_dir()) if self.scenario_dir else ""
         }
 
-        return json.dumps({
-            "success": True,
-            "action": "return_to_init",
-            "message": "已设置返回Init Agent标志，系统将在本轮结束后切换回设计阶段",
-            "trigger_reason": trigger_reason
-        }, ensure_ascii=False)
+        return f'{self._LAYER1_FIX_PREFIX},"trigger_reason":{_dumps(trigger_reason)}}}'
 
     # ========== Agent接口实现 ==========
 
     def get_system_prompt(self, context: Dict[str, Any]) -> str:
         """获取系统提示词"""
-        # 获取工作目录（从design_artifacts中提取）
-        working_dir = context.get("design_artifacts", {}).get("scenario_dir", "outputs/<scenario_name>/")
-
-        base_prompt = f"""## 定位
-
-你是Execute Agent，负责合成高质量、高难度的Agent评测样本（Layer 2-3-4）。
-
-你有一个设计师伙伴**Init Agent**负责Layer 1设计工作（BusinessRules.md、unified_scenario_design.yaml等）。当你发现设计文件有问题时，使用`request_layer1_fix`工具请求Init Agent修改，不要自己改设计文件。
-
-**接收的Context**：
-- `design_artifacts["scenario_dir"]`: 场景目录（你的工作根目录）
-- `design_artifacts`: Init Agent的设计产物（场景名、各设计文件路径）
-- `user_requirement`: 用户原始需求
-- `iteration`: 当前迭代次数
-
-如果用户要求修改**设计文件本身**（BusinessRules.md、unified_scenario_design.yaml），这超出了你的职责。应该使用 `request_layer1_fix` 工具请求返回设计阶段，系统会自动切换回Init Agent进行设计修改。
-
-如果是修改**执行层面的代码**（tools/*.py、checkers/*.py、样本生成逻辑），这是你的职责，可以往下工作。
-
-## 目录结构约定
-
-你的工作目录是：`{working_dir}`
-
-关键文件位置（相对于工作目录）：
-- **设计文件**：`unified_scenario_design.yaml`
-- **业务规则**：`BusinessRules.md`
-- **样本文件**：`samples/eval.jsonl`
-- **Benchkit**：`benchkit/`（已自动拷贝）
-- **评测输出**：`evaluation_outputs/`
-
-执行 benchkit 命令时，确保在工作目录下执行，所有路径使用相对路径。
-
-## 核心目标
-
-**最终交付物**：高质量、高难度、有区分度的Agent评测样本集
-
-**关键原则**：
-- ✅ 样本质量和难度是核心目标
-- ✅ 评测是为了发现和修复**样本设计问题**和**系统问题**
-- ❌ **不追求高成功率** - 样本应该有难度，失败是正常的
-- ❌ **不降低难度来提高成功率** - 这完全背离目标
-
-## 评测结果的正确使用
-
-**评测的作用**：诊断问题，而非证明样本好
-
-当评测失败时，分析失败原因：
-1. **样本设计问题**：
-   - Checker配置不合理（过严/过松、临界值错误）
-   - BusinessRules描述模糊、矛盾
-   - Checklist与Query不一致
-   - 用户模拟器prompt设计不当
-   → **修复样本设计**
-
-2. **系统问题**：
-   - Tool实现有bug
-   - Checker逻辑错误
-   - Tool返回格式不符合规范
-   → **修复代码**
-
-3. **Agent能力问题**：
-   - Agent未遵循规则、信息收集不足、执行错误等
-   → **这是正常的评测结果，保留样本**
-
-**错误做法示例**：
-- ❌ "成功率只有60%，我要简化样本来提高成功率"
-- ❌ "太多失败了，我要放宽checker条件"
-- ✅ "成功率60%，分析失败原因：3个样本设计问题已修复，5个是Agent能力问题（符合预期）"
-
-## 完成条件
-
-任务完成的判断标准：
-1. **样本质量合格**：无样本设计缺陷、无系统bug
-2. **难度和覆盖面达标**：有效测试目标能力、有足够区分度
-3. **数量充足**：达到预期样本数量
-
-**不是**"成功率>=85%"！成功率取决于被测模型能力和样本难度。
-
-**完成后的行为**：使用`ask_human`工具汇报完成情况（哪些层完成、样本数量、评测结果），请求人工确认是否满意或需要进一步优化。
-
-## 执行流程（Layer 2-4）
-
-**必须按顺序完成以下步骤**：
-
-### Layer 2: 组件代码生成
-1. **生成tools/** - 根据unified_scenario_design.yaml中的tools定义实现MCP工具
-2. **生成checkers/** - 根据checkers定义实现验证逻辑
-3. **生成data_pools/** - 根据entities定义创建测试数据（JSONL格式）
-   - ⚠️ **必须生成**，即使场景初始状态为空也要创建目录结构
-   - 每个entity对应一个`data_pools/{entity}.jsonl`文件
-   - 数据要覆盖所有筛选条件组合，确保样本生成时能匹配到数据
-4. 运行单元测试验证组件正确性（可选）
-
-### Layer 3: 样本合成
-5. **生成样本生成器** - 基于data_pools、user_need_templates实现
-6. **运行生成器** - 产出`samples/eval.jsonl`
-   - ⚠️ **样本格式必须严格遵循规范**：`.claude/skills/sample_authoring/references/sample_format_spec.json`
-   - 必需字段：data_id, query, system, servers, environment, check_list
-   - 在实现生成器前，**必须先用file_reader读取sample_format_spec.json**了解格式
-7. 验证样本格式和质量
-
-### Layer 4: 评测与迭代
-8. 运行小规模评测（5-10个样本）
-9. 分析失败原因（样本问题/系统问题/Agent能力问题）
-10. 修复样本设计问题和系统bug
-11. （可选）运行完整评测并生成报告
-
-## 交付物（使用相对路径）
-
-**重要**：所有文件路径必须是相对于场景目录的相对路径，不要包含场景目录本身！
-
-正确写法：
-- tools/xxx.py
-- checkers/checker.py
-- data_pools/xxx.jsonl
-- samples/eval.jsonl
-
-错误写法（绝对不要这样）：
-- outputs/场景名/tools/xxx.py  ← 错误！会导致嵌套
-- /Users/.../tools/xxx.py     ← 错误！
-
-目录结构：
-```
-<场景目录>/           # file_writer 的 base_dir，不需要写这部分
-├── tools/           # 写 "tools/xxx.py"
-├── checkers/        # 写 "checkers/checker.py"
-├── data_pools/      # 写 "data_pools/xxx.jsonl"
-├── samples/         # 写 "samples/eval.jsonl"
-└── execution_outputs/
-```
-
-## 禁止行为
-
-- ❌ 创建冗余的"完成报告"、"状态总结"、"使用指南"等markdown文档（如COMPLETION_REPORT.md、FINAL_STATUS.md、QUICK_START.md）
-- ❌ 创建额外的测试样本文件（如test_5.jsonl、test_sample.jsonl），应直接使用samples/eval.jsonl配合executor的--limit参数
-- ❌ 反复展示样本内容、统计信息、验证结果
-- ❌ 在达到完成条件后继续创建文档或执行操作，应立即调用`ask_human`请求确认
-
-## 可用技能
-
-通过use_skill工具获取参考资源（详细列表见工具描述）：
-- **scenario_design_sop**: 五种难度提升方法（复杂规则、领域知识、多轮变更等）
-- **tool_implementation**: 工具实现模板和示例
-- **checker_implementation**: Checker实现指南
-- **sample_authoring**: 样本合成SOP（质量标准、格式规范）
-- **evaluation_execution**: 评测执行指南（benchkit使用）
-- **failure_analysis**: 失败案例归因分析（区分样本问题/系统问题/Agent能力问题）
-"""
-
-        # 动态追加场景配置信息
         design_artifacts = context.get("design_artifacts", {})
-        iteration = context.get("iteration", 1)
-
-        # 直接从artifacts获取场景目录（必须提供）
+        # 直接从artifacts获取场景目录（有场景目录时追加场景配置信息）
         scenario_dir = design_artifacts.get("scenario_dir")
-
-        # 如果有场景配置信息，追加到system prompt
-        if scenario_dir:
-            config_section = f"""
-
-## 工作环境
-
-**场景目录**: {scenario_dir}
-
-**所有工具的工作目录**: 场景目录（{scenario_dir}）
-- file_reader/file_writer/file_editor: 相对路径基于场景目录
-- bash: 工作目录就是场景目录
-- 例如: file_reader("tools/xxx.py") 读取 {scenario_dir}/tools/xxx.py
-- 例如: bash("python benchkit/executor.py ...") 在 {scenario_dir} 下执行
-
-**benchkit位置**: {scenario_dir}/benchkit/
-- 系统已自动将benchkit拷贝到场景目录
-- 配置文件: benchkit/model_config.json
-- 执行器: benchkit/executor.py
-
-## ⚠️ Benchkit使用规范（重要）
-
-**关键原则**：Benchkit是黑盒评测工具，遇到问题时**不要深入debug，立即ask_human**
-
-**正确使用方式**：
-1. **必须使用** `use_skill(skill_type="evaluation_execution")` 获取正确的使用指南
-2. **严格按照skill文档中的命令执行**，不要自行修改路径或参数
-
-**🚨 强制规则：3次失败必须停止**
-
-执行benchkit命令时，如果遇到错误：
-- **第1次失败**：检查命令拼写、参数是否完整
-- **第2次失败**：检查配置文件benchkit/model_config.json是否存在
-- **第3次失败**：**立即调用ask_human**，提供完整的命令、错误信息、已尝试的方案
-
-**绝对禁止**：
-- ❌ 连续尝试5次以上不同的命令变体
-- ❌ 阅读benchkit源码试图理解内部实现
-- ❌ 修改benchkit源代码或配置来"修复"问题
-- ❌ 发明benchkit不支持的CLI参数（如--model-config）
-- ❌ 在场景目录下创建benchkit/model_config.json副本
-
-**遇到以下情况立即ask_human**：
-- 连续3次出现 `required arguments` 错误
-- 出现 `API connection error` 或 `401 Unauthorized`
-- 找不到 `benchkit/model_config.json`
-- MCP服务器启动失败
-- executor.py的`--help`输出与skill文档不符
-"""
-            return base_prompt + config_section
-
-        return base_prompt
+        # 获取工作目录（从design_artifacts中提取）
+        working_dir = scenario_dir or "outputs/<scenario_name>/"
+        return _render_system_prompt(working_dir, scenario_dir)
 
     def build_initial_message(self, context: Dict[str, Any]) -> str:
         """
@@ -675,11 +974,20 @@ class ScenarioBuilderAgent(BaseAgent):
             return None
 
         samples_file = self.scenario_dir / "samples" / "eval.jsonl"
-        if not samples_file.exists():
+        try:
+            mtime = samples_file.stat().st_mtime_ns
+        except FileNotFoundError:
             return None
 
-        # 直接调用验证函数
-        return validate_jsonl_file(samples_file)
+        # 文件自上次验证后未变化，直接复用结果
+        if mtime == self._last_validated_mtime:
+            return self._last_validation_result
+
+        # 反馈只展示前5个错误，多收集1个用于判断是否还有更多
+        result = self._sample_validator.validate(samples_file, max_errors=self.SAMPLE_ERROR_DISPLAY_LIMIT + 1)
+        self._last_validated_mtime = mtime
+        self._last_validation_result = result
+        return result
 
     def _check_and_inject_sample_validation_feedback(self, raw_messages: List[Dict]) -> bool:
         """
@@ -707,25 +1015,17 @@ class ScenarioBuilderAgent(BaseAgent):
         errors = validation_result.get("errors", [])
         error_summary = validation_result.get("error_summary", "格式错误")
 
-        # 只显示前5个错误
-        error_details = "\n".join(f"  - {e}" for e in errors[:5])
-        if len(errors) > 5:
-            error_details += f"\n  ... 以及其他 {len(errors) - 5} 个错误"
-
-        reminder = f"""⚠️  刚才写入的样本文件 samples/eval.jsonl 格式验证未通过！
+        # 只显示前5个错误（验证在第6个错误处停止，剩余数量未知）
+        error_details = "\n".join(f"  - {e}" for e in errors[:self.SAMPLE_ERROR_DISPLAY_LIMIT])
+        if len(errors) > self.SAMPLE_ERROR_DISPLAY_LIMIT:
+            error_details += "\n  ... 以及更多错误"
 
-{error_summary}
-
-详细错误：
-{error_details}
-
-请读取 .claude/skills/sample_authoring/references/sample_format_spec.json 了解正确格式，然后修正生成器或直接编辑样本文件。"""
+        reminder = self._SAMPLE_FORMAT_REMINDER.format(error_summary=error_summary, error_details=error_details)
 
         # 注入反馈消息 - 作为独立的user消息
-        from .base_agent import _console
-        _console.print(f"  [验证Hook] 样本格式不合规，注入即时反馈", style="yellow")
+        _console.print("  [验证Hook] 样本格式不合规，注入即时反馈", style="yellow")
 
-        raw_messages.append({"role": "user", "content": reminder})
+        self._append_message(raw_messages, {"role": "user", "content": reminder})
         self._samples_validation_reminded = True
 
         return True
@@ -800,3 +1100,10 @@ class ScenarioBuilderAgent(BaseAgent):
         # 样本文件刚写入，立即触发验证Hook
         if samples_file_written:
             self._check_and_inject_sample_validation_feedback(raw_messages)
+
+    def close(self):
+        """落盘尚未写入的文件，结束常驻bash进程和工具线程"""
+        self._flush_file_writer()
+        if self._bash is not None:
+            self._bash.close()
+        super().close()
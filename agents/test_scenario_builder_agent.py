@@ -2,25 +2,25 @@
 Execute Agent单元测试 - 测试工具和核心流程
 """
 import json
-import shutil
 import unittest
 from pathlib import Path
 
 from agents import ExecuteAgent
+from testutils import TempDirTestCase
 
 
-class TestExecuteAgentTools(unittest.TestCase):
+class TestExecuteAgentTools(TempDirTestCase):
     """测试Execute Agent的工具函数"""
 
     def setUp(self):
         """测试前准备"""
-        self.test_dir = Path("test_execute_outputs")
-        self.test_dir.mkdir(exist_ok=True)
+        super().setUp()
 
         # 创建测试场景目录结构
-        self.scenario_dir = self.test_dir / "test_scenario"
+        self.scenario_dir = self.tmp_dir / "test_scenario"
+        self.scenario_dir.mkdir()
         for subdir in ["tools", "checkers", "data_pools", "samples", "execution_outputs"]:
-            (self.scenario_dir / subdir).mkdir(parents=True, exist_ok=True)
+            (self.scenario_dir / subdir).mkdir()
 
         # 创建测试设计文件
         (self.scenario_dir / "unified_scenario_design.yaml").write_text("test: yaml")
@@ -30,8 +30,7 @@ class TestExecuteAgentTools(unittest.TestCase):
 
     def tearDown(self):
         """测试后清理"""
-        if self.test_dir.exists():
-            shutil.rmtree(self.test_dir)
+        self.agent.close()
 
     def test_read_design_file(self):
         """测试读取设计文件"""
@@ -147,8 +146,14 @@ class TestExecuteAgentTools(unittest.TestCase):
 class TestExecuteAgentSystemPrompt(unittest.TestCase):
     """测试系统提示词"""
 
-    def setUp(self):
-        self.agent = ExecuteAgent()
+    @classmethod
+    def setUpClass(cls):
+        # 只读取提示词，不修改Agent状态，整个类共用一个实例
+        cls.agent = ExecuteAgent()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.agent.close()
 
     def test_basic_prompt(self):
         """测试基本提示词"""
@@ -160,20 +165,18 @@ class TestExecuteAgentSystemPrompt(unittest.TestCase):
         self.assertIn("Layer 4", prompt)
 
 
-class TestExecuteAgentCompletion(unittest.TestCase):
+class TestExecuteAgentCompletion(TempDirTestCase):
     """测试完成检查"""
 
     def setUp(self):
-        self.test_dir = Path("test_execute_outputs2")
-        self.test_dir.mkdir(exist_ok=True)
-        self.scenario_dir = self.test_dir / "test_scenario"
+        super().setUp()
+        self.scenario_dir = self.tmp_dir / "test_scenario"
         self.scenario_dir.mkdir(parents=True, exist_ok=True)
         self.agent = ExecuteAgent()
         self.agent.scenario_dir = self.scenario_dir
 
     def tearDown(self):
-        if self.test_dir.exists():
-            shutil.rmtree(self.test_dir)
+        self.agent.close()
 
     def test_check_completion_completed(self):
         """测试完成状态检查"""
@@ -7,10 +7,30 @@ import logging
 import os
 import time
 from typing import Any, Dict, List, Optional
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+# 所有MCPAgent共享的HTTP会话：每轮对话复用keep-alive连接，不重新建立TCP/TLS连接
+# （并发执行多个样本时各线程共用连接池，pool_maxsize 需不小于并发度）
+_HTTP_SESSION = requests.Session()
+_HTTP_SESSION.mount("https://", HTTPAdapter(pool_maxsize=32))
+_HTTP_SESSION.mount("http://", HTTPAdapter(pool_maxsize=32))
+
+
+def _tool_json(value: Any) -> str:
+    """
+    序列化工具参数/结果
+
+    MCP工具结果可能含非str键或超出64位的整数，orjson不支持时退回json.dumps
+    """
+    try:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    except orjson.JSONEncodeError:
+        return json.dumps(value, ensure_ascii=False)
+
 
 class MCPAgent:
     """MCP Agent - 通过LLM调用MCP工具完成任务"""
@@ -43,6 +63,7 @@ class MCPAgent:
         self.temperature = temperature
         self.tools = []
         self._load_tools()
+        self._prepare_request_template()
 
     def _load_tools(self):
         """从MCP服务器加载工具列表并转换为OpenAI格式"""
@@ -65,23 +86,27 @@ class MCPAgent:
             }
             self.tools.append(openai_tool)
 
-    def _call_llm(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """调用LLM API，支持429/5xx重试"""
-        headers = {
+    def _prepare_request_template(self):
+        """预先序列化请求中不随轮次变化的部分（headers、模型参数、工具定义）"""
+        self._headers = {
             "Content-Type": "application/json",
             "Authorization": f"Bearer {self.api_key}"
         }
-
-        payload = {
-            "model": self.model,
-            "messages": messages,
-            "temperature": self.temperature,
-        }
-
-        # 添加工具定义
+        self._payload_prefix = (
+            b'{"model":' + orjson.dumps(self.model)
+            + b',"temperature":' + orjson.dumps(self.temperature)
+            + b',"messages":'
+        )
         if self.tools:
-            payload["tools"] = self.tools
-            payload["tool_choice"] = "auto"
+            # 添加工具定义
+            self._payload_suffix = b',"tools":' + orjson.dumps(self.tools) + b',"tool_choice":"auto"}'
+        else:
+            self._payload_suffix = b"}"
+
+    def _call_llm(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """调用LLM API，支持429/5xx重试"""
+        # 每轮只序列化messages，其余部分拼接预先序列化好的片段
+        body = self._payload_prefix + orjson.dumps(messages) + self._payload_suffix
 
         # 重试配置
         max_retries = 3
@@ -89,14 +114,14 @@ class MCPAgent:
 
         for attempt in range(max_retries):
             try:
-                response = requests.post(
+                response = _HTTP_SESSION.post(
                     f"{self.base_url}/chat/completions",
-                    headers=headers,
-                    json=payload,
+                    headers=self._headers,
+                    data=body,
                     timeout=120
                 )
                 response.raise_for_status()
-                return response.json()
+                return orjson.loads(response.content)
 
             except requests.exceptions.HTTPError as e:
                 status_code = e.response.status_code if e.response else None
@@ -212,18 +237,24 @@ class MCPAgent:
                     tool_name = function.get("name", "")
                     arguments_str = function.get("arguments", "{}")
 
-                    try:
-                        arguments = json.loads(arguments_str)
-                    except json.JSONDecodeError:
+                    if arguments_str in ("", "{}"):
+                        # 无参数工具调用（部分模型给出空字符串），不需要解析
                         arguments = {}
-                        logger.warning(f"工具参数解析失败: {arguments_str}")
+                    else:
+                        try:
+                            arguments = orjson.loads(arguments_str)
+                        except orjson.JSONDecodeError:
+                            arguments = {}
+                            logger.warning(f"工具参数解析失败: {arguments_str}")
 
                     logger.info(f"调用工具: {tool_name}({arguments})")
 
                     # 通过MCP客户端调用工具
                     tool_result = self.mcp_client.call_tool(tool_name, arguments)
 
-                    logger.info(f"工具返回: {tool_name} -> {json.dumps(tool_result, ensure_ascii=False)[:200]}...")
+                    # 工具结果只序列化一次，日志、工具调用记录和消息历史共用
+                    result_json = _tool_json(tool_result)
+                    logger.info(f"工具返回: {tool_name} -> {result_json[:200]}...")
 
                     # 记录工具调用（拆分server_name和name）
                     if "__" in tool_name:
@@ -235,15 +266,15 @@ class MCPAgent:
                     tool_call_list.append({
                         "server_name": server_name,
                         "name": pure_tool_name,
-                        "arguments": json.dumps(arguments, ensure_ascii=False),
-                        "result": json.dumps(tool_result, ensure_ascii=False)
+                        "arguments": _tool_json(arguments),
+                        "result": result_json
                     })
 
                     # 添加工具结果到消息历史
                     tool_message = {
                         "role": "tool",
                         "tool_call_id": tool_id,
-                        "content": json.dumps(tool_result, ensure_ascii=False)
+                        "content": result_json
                     }
                     messages.append(tool_message)
 
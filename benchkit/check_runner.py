@@ -1,8 +1,40 @@
+import hashlib
 import json
 import os
+import re
+import shutil
+import signal
 import subprocess
+import tempfile
+import threading
+from collections import deque
 from pathlib import Path
-from typing import Dict, Optional, Union
+from typing import Any, Dict, Optional, Tuple, Union
+
+import orjson
+
+# 至少19位的数字串：可能是超出64位的整数（orjson会静默转成float）
+_LONG_DIGITS_RE = re.compile(rb"\d{19,}")
+
+
+def loads_json(data: bytes) -> Any:
+    """
+    解析JSON，结果与标准库 json.loads 一致
+
+    默认用orjson；orjson不接受的内容（如checker用json.dump写出的NaN/Infinity）
+    或含可能超出64位的整数时改用 json.loads
+    """
+    if _LONG_DIGITS_RE.search(data):
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+
+def _dumps_bench(bench_obj: Dict) -> bytes:
+    """序列化传给checker的样本（用json：loads_json 解析出的NaN/大整数原样写回，orjson会写成null或报错）"""
+    return json.dumps(bench_obj, ensure_ascii=False).encode("utf-8")
 
 
 class CheckRunner:
@@ -11,10 +43,14 @@ class CheckRunner:
 
     约定：
     - check.py 支持 --bench 与 --result 两个参数
+      （bench_via_stdin=True 时 --bench 为 /dev/stdin，要求 checker 只读取一次 bench 文件）
     - 可能需要 --model/--base-url/--api-key（若包含 LLM Judge）
     - 默认输出 check_result.json（也允许 --output 覆写）
     """
 
+    # 失败时报告的stderr末尾行数（checker的日志可能很多，只保留末尾）
+    STDERR_TAIL_LINES = 128
+
     def __init__(
         self,
         check_script: Union[str, Path],
@@ -22,20 +58,21 @@ class CheckRunner:
         model: Optional[str] = None,
         base_url: Optional[str] = None,
         api_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        bench_via_stdin: bool = False,
     ):
         self.check_script = str(check_script)
+        # 单个样本的checker超时（秒），None表示不限制
+        self.timeout = timeout
+        # bench_obj 经 stdin 传给 checker（不落临时文件）；默认写临时文件，兼容会多次打开bench的checker
+        self.bench_via_stdin = bench_via_stdin
+        # 使用绝对路径避免cwd导致的路径问题（脚本路径不变，只解析一次）
+        self._check_script_abs = str(Path(check_script).absolute())
         self.work_dir = str(work_dir) if work_dir else None
         # 统一模型配置加载（model + provider）
         self.model = model
         self.base_url = base_url
         self.api_key = api_key
-
-    def run(
-        self,
-        bench_file: Union[str, Path],
-        result_file: Union[str, Path],
-        output_file: Optional[Union[str, Path]] = None,
-    ) -> Dict:
         # 若未显式提供，加载 benchkit 模型配置
         if not (self.model and (self.base_url or os.getenv("BENCH_CHECK_PROVIDER"))):
             try:
@@ -52,6 +89,40 @@ class CheckRunner:
             except Exception:
                 pass
 
+    def run(
+        self,
+        bench_file: Optional[Union[str, Path]] = None,
+        result_file: Optional[Union[str, Path]] = None,
+        output_file: Optional[Union[str, Path]] = None,
+        bench_obj: Optional[Dict] = None,
+    ) -> Dict:
+        """
+        运行checker
+
+        bench_obj 为内存中的样本时，写入临时bench文件传给 checker（结束后删除）；
+        bench_via_stdin=True 时改为经 stdin 传入（--bench /dev/stdin）
+        """
+        if (bench_file is None) == (bench_obj is None):
+            raise ValueError("bench_file 与 bench_obj 必须且只能提供一个")
+        if bench_obj is None or self.bench_via_stdin:
+            return self._run(bench_file, result_file, output_file, bench_obj)
+
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            tmp.write(_dumps_bench(bench_obj))
+        try:
+            return self._run(tmp.name, result_file, output_file, None)
+        finally:
+            os.unlink(tmp.name)
+
+    def _run(
+        self,
+        bench_file: Optional[Union[str, Path]],
+        result_file: Union[str, Path],
+        output_file: Optional[Union[str, Path]],
+        bench_obj: Optional[Dict],
+    ) -> Dict:
+        """运行checker（bench_obj 不为None时经 stdin 传入）"""
+
         # 读取result.json获取env_dir（支持选项2：在result中指定环境路径）
         env_dir = None
         try:
@@ -61,13 +132,13 @@ class CheckRunner:
         except Exception:
             pass
 
-        # 使用绝对路径避免cwd导致的路径问题
-        check_script_abs = Path(self.check_script).absolute()
+        # 使用绝对路径避免cwd导致的路径问题（已是绝对路径时 absolute() 不再查询cwd）
+        bench_arg = "/dev/stdin" if bench_obj is not None else str(Path(bench_file).absolute())
         cmd = [
             "python",
-            str(check_script_abs),
+            self._check_script_abs,
             "--bench",
-            str(Path(bench_file).absolute()),
+            bench_arg,
             "--result",
             str(Path(result_file).absolute()),
         ]
@@ -91,27 +162,130 @@ class CheckRunner:
 
         # 不设置cwd，避免在某些环境下os.getcwd()失败（litellm导入时会调用）
         # 所有路径都已转换为绝对路径，不需要依赖工作目录
-        # 传递环境变量给子进程（GitHub场景需要GITHUB_PERSONAL_ACCESS_TOKEN等）
-        proc = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8', errors='replace', env=os.environ.copy())
-        if proc.returncode != 0:
-            raise RuntimeError(f"check脚本执行失败: {proc.returncode}\nSTDOUT:{proc.stdout}\nSTDERR:{proc.stderr}")
+        # 子进程直接继承当前环境变量（GitHub场景需要GITHUB_PERSONAL_ACCESS_TOKEN等），不逐次复制
+        # 输出按bytes收集，只在失败或需要从stdout解析结果时才解码
+        bench_input = _dumps_bench(bench_obj) if bench_obj is not None else None
+        returncode, stdout, stderr_tail = self._run_checker(cmd, bench_input)
+        if returncode is None:
+            raise RuntimeError(f"check脚本执行超时（{self.timeout}秒）\nSTDERR(末尾):{stderr_tail}")
+        if returncode != 0:
+            stdout_text = stdout.decode("utf-8", errors="replace")
+            raise RuntimeError(f"check脚本执行失败: {returncode}\nSTDOUT:{stdout_text}\nSTDERR(末尾):{stderr_tail}")
 
         # 优先读显式 output_file，否则默认文件名
         out_path = Path(output_file) if output_file else Path(self.work_dir or ".") / "check_result.json"
         if not out_path.exists():
             # 某些场景直接在stdout打印JSON结果，尝试解析
             try:
-                return json.loads(proc.stdout.strip())
+                return loads_json(stdout.strip())
             except Exception:
                 pass
             raise FileNotFoundError(f"未发现检查结果文件: {out_path}")
 
-        with open(out_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return loads_json(out_path.read_bytes())
+
+    # 子进程退出后等待输出读取线程的秒数（进程组已被结束，管道应很快关闭）
+    READER_JOIN_TIMEOUT = 5
+
+    def _run_checker(self, cmd: list, bench_input: Optional[bytes]) -> Tuple[Optional[int], bytes, str]:
+        """
+        运行checker子进程
+
+        stdout完整收集（部分checker在stdout打印结果），stderr只保留末尾 STDERR_TAIL_LINES 行；
+        bench_input 由单独的线程写入stdin（checker不读stdin时不会阻塞超时判断）。
+        checker在独立进程组中运行，超过 self.timeout 或退出后都结束整个进程组，
+        遗留的子进程不会占着管道让读取线程一直等待
+
+        Returns:
+            (返回码，超时为None, stdout, stderr末尾)
+        """
+        proc = subprocess.Popen(
+            cmd,
+            stdin=subprocess.PIPE if bench_input is not None else None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+        )
+        stdout_chunks: list = []
+        stderr_tail: deque = deque(maxlen=self.STDERR_TAIL_LINES)
+        threads = [
+            threading.Thread(target=lambda: stdout_chunks.append(proc.stdout.read()), daemon=True),
+            threading.Thread(target=stderr_tail.extend, args=(proc.stderr,), daemon=True),
+        ]
+        if bench_input is not None:
+            threads.append(threading.Thread(target=self._write_stdin, args=(proc.stdin, bench_input), daemon=True))
+        for thread in threads:
+            thread.start()
+
+        try:
+            returncode = proc.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            returncode = None
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+
+        for thread in threads:
+            thread.join(self.READER_JOIN_TIMEOUT)
+        proc.stdout.close()
+        proc.stderr.close()
+        stdout = b"".join(stdout_chunks)
+        stderr = b"".join(stderr_tail).decode("utf-8", errors="replace")
+        return returncode, stdout, stderr
+
+    @staticmethod
+    def _write_stdin(stdin, data: bytes):
+        """向checker的stdin写入bench（在线程中执行）"""
+        try:
+            stdin.write(data)
+            stdin.close()
+        except (OSError, ValueError):
+            # checker未读取bench就退出（或已被结束），以返回码为准
+            pass
+
+
+# checker依赖的场景目录（checker.py会import checkers/下的模块、读取data_pools/下的数据）
+CHECK_DEPENDENCY_DIRS = ("checkers", "data_pools")
+
+
+def check_dependencies_digest(scenario_dir: Union[str, Path]) -> str:
+    """
+    checker依赖文件的摘要：CHECK_DEPENDENCY_DIRS 下所有文件的相对路径和内容（批量评测前计算一次）
+    """
+    scenario_dir = Path(scenario_dir)
+    digest = hashlib.sha256()
+    for dep_dir in CHECK_DEPENDENCY_DIRS:
+        root = scenario_dir / dep_dir
+        for path in sorted(p for p in root.rglob("*") if p.is_file() and "__pycache__" not in p.parts):
+            digest.update(path.relative_to(scenario_dir).as_posix().encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()
+
+
+def check_cache_key(check_script: Union[str, Path], bench_obj: Dict, result_file: Union[str, Path],
+                    model: Optional[str], dependencies_digest: str = "") -> str:
+    """
+    检查结果的缓存key：checker脚本及其依赖（见 check_dependencies_digest）、样本、Agent结果和
+    Judge模型都不变时，检查结果可复用
+    """
+    digest = hashlib.sha256()
+    digest.update(Path(check_script).read_bytes())
+    digest.update(dependencies_digest.encode("utf-8"))
+    try:
+        digest.update(orjson.dumps(bench_obj, option=orjson.OPT_SORT_KEYS))
+    except orjson.JSONEncodeError:
+        # 超出64位的整数等orjson不支持的值
+        digest.update(json.dumps(bench_obj, ensure_ascii=False, sort_keys=True).encode("utf-8"))
+    digest.update(Path(result_file).read_bytes())
+    digest.update((model or "").encode("utf-8"))
+    return digest.hexdigest()
 
 
 if __name__ == "__main__":
     import argparse
+    import itertools
     import sys
 
     parser = argparse.ArgumentParser(description="批量运行Checker评测")
@@ -122,12 +296,19 @@ if __name__ == "__main__":
     parser.add_argument("--model", help="LLM Judge模型名称")
     parser.add_argument("--base-url", help="LLM Judge API URL")
     parser.add_argument("--api-key", help="LLM Judge API密钥")
+    parser.add_argument("--timeout", type=float, default=600, help="单个样本的checker超时秒数（默认600）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略已缓存的检查结果，全部重新评测")
+    parser.add_argument("--bench-stdin", action="store_true",
+                        help="样本经stdin传给checker（--bench /dev/stdin），不写临时文件；要求checker只读取一次bench")
+    parser.add_argument("--max-concurrency", type=int, default=4,
+                        help="并发评测的checker进程数（默认4，checker多在等待LLM Judge，注意rate limit）")
 
     args = parser.parse_args()
 
-    scenario_dir = Path(args.scenario)
-    results_dir = Path(args.results_dir)
-    output_dir = Path(args.output_dir)
+    # 批量评测前一次性转为绝对路径，每个样本的路径都由它们拼接得到
+    scenario_dir = Path(args.scenario).absolute()
+    results_dir = Path(args.results_dir).absolute()
+    output_dir = Path(args.output_dir).absolute()
 
     # 查找checker脚本
     checker_script = scenario_dir / "checker.py"
@@ -144,16 +325,22 @@ if __name__ == "__main__":
     # 创建输出目录
     cases_dir = output_dir / "cases"
     cases_dir.mkdir(parents=True, exist_ok=True)
+    # 检查结果缓存（输入未变的样本直接复用上次结果，不再启动checker）
+    cache_dir = output_dir / ".check_cache"
+    cache_dir.mkdir(exist_ok=True)
+    # checkers/、data_pools/ 变化时缓存失效
+    dependencies_digest = check_dependencies_digest(scenario_dir)
 
-    # 加载样本
-    samples = []
-    with open(samples_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            if line.strip():
-                samples.append(json.loads(line))
+    # 按行流式读取样本（指定--limit时只解析前limit条）
+    def iter_samples(path: Path):
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield loads_json(line)
 
+    samples = iter_samples(samples_file)
     if args.limit:
-        samples = samples[:args.limit]
+        samples = itertools.islice(samples, args.limit)
 
     # 创建CheckRunner
     runner = CheckRunner(
@@ -161,47 +348,77 @@ if __name__ == "__main__":
         work_dir=scenario_dir,
         model=args.model,
         base_url=args.base_url,
-        api_key=args.api_key
+        api_key=args.api_key,
+        timeout=args.timeout,
+        bench_via_stdin=args.bench_stdin
     )
 
-    # 批量评测
-    success_count = 0
-    error_count = 0
-    import tempfile
+    # 批量评测：每个样本是独立的checker子进程，线程只负责等待子进程，多个样本可并行占用多核
+    from concurrent.futures import ThreadPoolExecutor
 
-    for sample in samples:
+    def check_sample(sample: Dict) -> Tuple[Any, Optional[bool], str]:
+        """
+        评测单个样本（在工作线程中执行，不打印）
+
+        Returns:
+            (data_id, 是否成功, overall_result或错误信息)；结果文件不存在时"是否成功"为None
+        """
         data_id = sample.get("data_id")
         result_file = results_dir / f"{data_id}.json"
 
         if not result_file.exists():
-            print(f"跳过 {data_id}: 结果文件不存在")
-            continue
+            return data_id, None, "结果文件不存在"
 
         output_file = cases_dir / f"check_{data_id}.json"
+        cache_key = check_cache_key(checker_script, sample, result_file, runner.model, dependencies_digest)
+        cache_file = cache_dir / f"{cache_key}.json"
 
-        # 为每个样本创建临时bench.json文件
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as tmp:
-            json.dump(sample, tmp, ensure_ascii=False, indent=2)
-            tmp_bench_file = tmp.name
+        if not args.no_cache and cache_file.exists():
+            shutil.copyfile(cache_file, output_file)
+            with open(output_file, 'r', encoding='utf-8') as f:
+                overall_result = json.load(f).get("overall_result", "Unknown")
+            return data_id, True, f"{overall_result}（缓存）"
 
         try:
-            print(f"评测 {data_id}...")
             check_result = runner.run(
-                bench_file=tmp_bench_file,
+                bench_obj=sample,
                 result_file=result_file,
                 output_file=output_file
             )
-            success_count += 1
-            overall_result = check_result.get("overall_result", "Unknown")
-            print(f"  ✓ {data_id}: {overall_result}")
+            # checker可能只在stdout打印结果而不写output_file，缓存以返回的结果为准
+            # （用json写出：结果中的NaN/超出64位的整数原样保留）
+            cache_file.write_text(json.dumps(check_result, ensure_ascii=False, indent=2), encoding="utf-8")
+            return data_id, True, check_result.get("overall_result", "Unknown")
         except Exception as e:
+            return data_id, False, str(e)
+
+    def iter_outcomes():
+        """
+        按样本顺序产出评测结果
+
+        分窗口提交（未完成的任务最多 max_concurrency*2 个），样本按需读取，不一次性全部提交
+        """
+        max_workers = max(args.max_concurrency, 1)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight: deque = deque()
+            for sample in samples:
+                if len(in_flight) >= max_workers * 2:
+                    yield in_flight.popleft().result()
+                in_flight.append(executor.submit(check_sample, sample))
+            while in_flight:
+                yield in_flight.popleft().result()
+
+    # 结果由主线程按样本顺序打印，并发评测时输出不会交错
+    success_count = 0
+    error_count = 0
+    for data_id, ok, info in iter_outcomes():
+        if ok is None:
+            print(f"跳过 {data_id}: {info}")
+        elif ok:
+            success_count += 1
+            print(f"  ✓ {data_id}: {info}")
+        else:
             error_count += 1
-            print(f"  ✗ {data_id}: {e}")
-        finally:
-            # 清理临时文件
-            try:
-                Path(tmp_bench_file).unlink()
-            except Exception:
-                pass
+            print(f"  ✗ {data_id}: {info}")
 
     print(f"\n评测完成: 成功 {success_count}, 失败 {error_count}")
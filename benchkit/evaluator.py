@@ -3,22 +3,25 @@ import argparse
 import json
 import logging
 import os
+import re
 import time
+from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from threading import Lock
 from typing import Dict, Iterable, List, Optional
 
+
 # 兼容包内/脚本执行两种方式
 try:
-    from .check_runner import CheckRunner
+    from .check_runner import CheckRunner, loads_json
     from .server_launcher import ServerLauncher
 except Exception:
     import sys
     from pathlib import Path as _Path
     _HERE = _Path(__file__).resolve().parent
     sys.path.insert(0, str(_HERE))
-    from check_runner import CheckRunner  # type: ignore
+    from check_runner import CheckRunner, loads_json  # type: ignore
     from server_launcher import ServerLauncher  # type: ignore
 
 
@@ -33,12 +36,13 @@ def setup_logging(verbose: bool = False):
 
 
 def iter_jsonl(path: Path) -> Iterable[Dict]:
-    with open(path, "r", encoding="utf-8") as f:
+    # 按bytes读取，直接解析UTF-8（不先解码成str；首尾空白解析时自行忽略）
+    # loads_json：NaN/Infinity、超出64位的整数与json.loads结果一致
+    with open(path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            if line.isspace():
                 continue
-            yield json.loads(line)
+            yield loads_json(line)
 
 
 def ensure_dir(p: Path):
@@ -70,22 +74,85 @@ def default_result_path(results_dir: Path, data_id) -> Path:
     return results_dir / f"{data_id}.json"
 
 
+# 已完成检查的样本清单（cases目录下，每行一个JSON编码的data_id，检查完成时追加）
+COMPLETED_MANIFEST = "completed.jsonl"
+_completed_lock = Lock()
+
+
+def mark_check_completed(per_case_dir: Path, data_id) -> None:
+    """
+    检查结果写入后，把data_id追加到已完成清单（并发检查时加锁）
+
+    清单不存在时（清单出现之前生成的输出目录）从已有的 check_*.json 补建，其中已包含本次结果；
+    上次中断留下没有换行的半行时先补换行，新记录不会粘在半行后面
+    """
+    manifest = per_case_dir / COMPLETED_MANIFEST
+    line = (json.dumps(data_id, ensure_ascii=False) + "\n").encode("utf-8")
+    with _completed_lock:
+        if not manifest.exists():
+            _build_completed_manifest(per_case_dir)
+            return
+        with open(manifest, "a+b") as f:
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+
+
+def write_case_result(out_path: Path, res: Dict) -> None:
+    """写入单个样本的检查结果，并记入已完成清单"""
+    # 用json写出：checker结果中的NaN、超出64位的整数原样保留（orjson会写成null或报错）
+    out_path.write_text(json.dumps(res, ensure_ascii=False, indent=2), encoding="utf-8")
+    mark_check_completed(out_path.parent, res["data_id"])
+
+
 def get_completed_checks(output_dir: Path) -> set:
-    """获取已完成评测的样本ID"""
-    completed = set()
+    """
+    获取已完成评测的样本ID（读取已完成清单，不逐个解析检查结果文件）
+
+    清单中解析失败的行（如进程中断时写了一半的最后一行）跳过；
+    对应的 check_*.json 已不存在的样本不算完成（只列一次目录，不打开文件）
+    """
     per_case_dir = output_dir / "cases"
     if not per_case_dir.exists():
-        return completed
+        return set()
+    manifest = per_case_dir / COMPLETED_MANIFEST
+    if not manifest.exists():
+        _build_completed_manifest(per_case_dir)
+    with os.scandir(per_case_dir) as entries:
+        check_names = {entry.name for entry in entries if entry.name.startswith("check_")}
+    completed = set()
+    with open(manifest, "rb") as f:
+        for line in f:
+            if line.isspace():
+                continue
+            try:
+                data_id = loads_json(line)
+            except ValueError:
+                continue
+            if f"check_{data_id}.json" in check_names:
+                completed.add(data_id)
+    return completed
+
+
+def _build_completed_manifest(per_case_dir: Path) -> None:
+    """为清单出现之前生成的输出目录补建已完成清单（扫描一次 check_*.json）"""
+    data_ids = []
     for check_file in per_case_dir.glob("check_*.json"):
         try:
-            with open(check_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                data_id = data.get("data_id")
-                if data_id:
-                    completed.add(data_id)
+            data_id = loads_json(check_file.read_bytes()).get("data_id")
         except Exception:
-            pass
-    return completed
+            continue
+        if data_id:
+            data_ids.append(data_id)
+    with open(per_case_dir / COMPLETED_MANIFEST, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(data_id, ensure_ascii=False) + "\n" for data_id in data_ids)
+
+
+# 标准化检查结果时移除的字段
+_DROPPED_RESULT_FIELDS = ("check_version", "task_id", "result_file_info")
+_LIST_FORMAT_STAT_FIELDS = ("required_check_count", "required_check_passed_count", "required_check_pass_rate")
 
 
 def standardize_check_result(res: Dict) -> Dict:
@@ -114,14 +181,7 @@ def standardize_check_result(res: Dict) -> Dict:
     """
     check_details = res.get("check_details")
 
-    # 如果已经是dict格式，只需删除不需要的字段
-    if isinstance(check_details, dict):
-        # 移除不需要的字段
-        res.pop("check_version", None)
-        res.pop("task_id", None)
-        res.pop("result_file_info", None)
-        return res
-
+    # 已经是dict格式时只需删除不需要的字段（见函数末尾）
     # 如果是list格式，转换为dict格式
     if isinstance(check_details, list):
         new_check_details = {}
@@ -178,18 +238,20 @@ def standardize_check_result(res: Dict) -> Dict:
                 res["error_reason"] = ""
 
         # 移除list格式特有的统计字段
-        res.pop("required_check_count", None)
-        res.pop("required_check_passed_count", None)
-        res.pop("required_check_pass_rate", None)
+        for key in _LIST_FORMAT_STAT_FIELDS:
+            res.pop(key, None)
 
     # 移除不需要的字段
-    res.pop("check_version", None)
-    res.pop("task_id", None)
-    res.pop("result_file_info", None)
+    for key in _DROPPED_RESULT_FIELDS:
+        res.pop(key, None)
 
     return res
 
 
+# 可重试的检查错误：429 Too Many Requests / 限速，以及 500/502/503/504 服务器错误
+_RETRYABLE_ERROR_RE = re.compile(r"429|rate limit|too many requests|50[0234]", re.IGNORECASE)
+
+
 def check_single_sample(
     item: Dict,
     runner: 'CheckRunner',
@@ -219,8 +281,7 @@ def check_single_sample(
     data_id = item.get("data_id")
 
     bench_path = tmp_bench_dir / f"bench_{data_id}.json"
-    with open(bench_path, "w", encoding="utf-8") as f:
-        json.dump(item, f, ensure_ascii=False)
+    bench_path.write_text(json.dumps(item, ensure_ascii=False), encoding="utf-8")
 
     result_path = default_result_path(results_dir, data_id)
     out_path = per_case_dir / f"check_{data_id}.json"
@@ -231,9 +292,8 @@ def check_single_sample(
     # 读取执行结果获取execution_status
     execution_status = None
     try:
-        with open(result_path, 'r', encoding='utf-8') as f:
-            exec_result = json.load(f)
-            execution_status = exec_result.get("execution_status")
+        exec_result = loads_json(result_path.read_bytes())
+        execution_status = exec_result.get("execution_status")
     except Exception:
         pass
 
@@ -247,8 +307,7 @@ def check_single_sample(
             "completion_status": "skipped",
             "completion_reason": "执行阶段失败，跳过检查阶段以节省成本"
         }
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(res, f, ensure_ascii=False, indent=2)
+        write_case_result(out_path, res)
         logging.info(f"[{index}/{total}] {data_id} - Skipped (执行阶段失败)")
         return res
 
@@ -266,8 +325,7 @@ def check_single_sample(
             # 添加execution_status到check结果
             res["execution_status"] = execution_status
             # 重新写入统一格式后的结果
-            with open(out_path, "w", encoding="utf-8") as f:
-                json.dump(res, f, ensure_ascii=False, indent=2)
+            write_case_result(out_path, res)
 
             # 记录检查结果
             check_time = time.time() - check_start_time
@@ -289,18 +347,8 @@ def check_single_sample(
             return res
         except Exception as e:
             last_error = e
-            error_msg = str(e).lower()
-
             # 判断是否是可重试的错误（LLM API限速或服务器错误）
-            is_retryable = any([
-                '429' in error_msg,  # Too Many Requests
-                'rate limit' in error_msg,
-                'too many requests' in error_msg,
-                '500' in error_msg,  # Internal Server Error
-                '502' in error_msg,  # Bad Gateway
-                '503' in error_msg,  # Service Unavailable
-                '504' in error_msg,  # Gateway Timeout
-            ])
+            is_retryable = _RETRYABLE_ERROR_RE.search(str(e)) is not None
 
             if is_retryable and attempt < max_retries:
                 # 使用指数退避策略
@@ -327,24 +375,30 @@ def check_single_sample(
         "completion_reason": f"检查失败: {last_error}",
         "error_reason": str(last_error)
     }
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump(res, f, ensure_ascii=False, indent=2)
+    write_case_result(out_path, res)
     return res
 
 
 def aggregate_summary(case_results: List[Dict]) -> Dict:
     total = len(case_results)
 
+    # 一次遍历统计：执行阶段失败的样本计入 execution_error，其余按检查结论计数
+    check_counts: Counter = Counter()
+    execution_error = 0
+    for r in case_results:
+        if r.get("execution_status") == "error":
+            execution_error += 1
+        else:
+            check_counts[r.get("overall_result")] += 1
+
     # 执行阶段统计
-    execution_error = sum(1 for r in case_results if r.get("execution_status") == "error")
     valid_count = total - execution_error
 
     # 检查阶段统计（只针对执行成功的样本）
-    executed_cases = [r for r in case_results if r.get("execution_status") != "error"]
-    check_success = sum(1 for r in executed_cases if r.get("overall_result") == "Success")
-    check_partial = sum(1 for r in executed_cases if r.get("overall_result") == "Partial")
-    check_failure = sum(1 for r in executed_cases if r.get("overall_result") == "Failure")
-    check_error = sum(1 for r in executed_cases if r.get("overall_result") == "Error")
+    check_success = check_counts["Success"]
+    check_partial = check_counts["Partial"]
+    check_failure = check_counts["Failure"]
+    check_error = check_counts["Error"]
 
     evaluable_count = check_success + check_partial + check_failure
 
@@ -427,14 +481,14 @@ def run_scenario(
             api_key=api_key,
         )
 
-        # 收集需要评测的样本（先扫描一遍找出已执行的）
+        # 收集需要评测的样本（列一次结果目录找出已执行的，不逐个stat结果文件）
+        result_names = {entry.name for entry in os.scandir(results_dir)} if results_dir.is_dir() else set()
         samples_to_check = []
         for item in iter_jsonl(samples_file):
             data_id = item.get("data_id")
             if data_id is None:
                 continue
-            result_path = default_result_path(results_dir, data_id)
-            if result_path.exists():
+            if default_result_path(results_dir, data_id).name in result_names:
                 samples_to_check.append(item)
 
         # Resume模式：跳过已完成的检查
@@ -451,14 +505,10 @@ def run_scenario(
             logging.info("没有需要检查的样本")
             return {"summary": {}, "cases": [], "output": str(output_dir)}
 
-        # 线程安全的结果收集
-        case_results: List[Dict] = []
-        results_lock = Lock()
-
-        def check_and_collect(idx_and_item):
-            """包装函数：检查样本并收集结果"""
+        def check_one(idx_and_item):
+            """包装函数：检查单个样本"""
             idx, item = idx_and_item
-            res = check_single_sample(
+            return check_single_sample(
                 item=item,
                 runner=runner,
                 tmp_bench_dir=tmp_bench_dir,
@@ -468,22 +518,18 @@ def run_scenario(
                 total=total_to_check,
                 max_retries=max_retries
             )
-            with results_lock:
-                case_results.append(res)
-            return res
 
-        # 根据并发度选择执行方式
+        # 根据并发度选择执行方式（结果按样本顺序收集，不需要加锁）
         if max_concurrency > 1:
             logging.info(f"使用并发检查模式，并发度: {max_concurrency}")
             with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
-                list(executor.map(
-                    check_and_collect,
+                case_results: List[Dict] = list(executor.map(
+                    check_one,
                     enumerate(samples_to_check, 1)
                 ))
         else:
             logging.info("使用顺序检查模式")
-            for idx, item in enumerate(samples_to_check, 1):
-                check_and_collect((idx, item))
+            case_results = [check_one(idx_and_item) for idx_and_item in enumerate(samples_to_check, 1)]
 
         summary = aggregate_summary(case_results)
         summary_path = output_dir / "summary.json"
@@ -0,0 +1,115 @@
+"""
+CheckRunner单元测试 - checker输出解析与检查结果缓存key
+"""
+import json
+import math
+import unittest
+
+from benchkit.check_runner import CheckRunner, check_cache_key, check_dependencies_digest, loads_json
+from testutils import TempDirTestCase
+
+
+class TestCheckCacheKey(TempDirTestCase):
+    """测试检查结果缓存key随输入变化失效"""
+
+    def setUp(self):
+        super().setUp()
+        self.scenario_dir = self.tmp_dir
+        (self.scenario_dir / "checkers").mkdir()
+        (self.scenario_dir / "data_pools").mkdir()
+        self.checker = self.scenario_dir / "checker.py"
+        self.checker.write_text("from checkers import rules\n")
+        self.rules = self.scenario_dir / "checkers" / "rules.py"
+        self.rules.write_text("THRESHOLD = 1\n")
+        (self.scenario_dir / "data_pools" / "users.json").write_text("[]")
+        self.result_file = self.scenario_dir / "result.json"
+        self.result_file.write_text(json.dumps({"answer": 1}))
+        self.sample = {"data_id": "s1", "query": "q"}
+
+    def _key(self) -> str:
+        deps = check_dependencies_digest(self.scenario_dir)
+        return check_cache_key(self.checker, self.sample, self.result_file, "judge", deps)
+
+    def test_key_is_stable(self):
+        """输入不变时key不变"""
+        self.assertEqual(self._key(), self._key())
+
+    def test_checker_dependency_invalidates(self):
+        """checkers/下的模块变化时key变化"""
+        before = self._key()
+        self.rules.write_text("THRESHOLD = 2\n")
+        self.assertNotEqual(self._key(), before)
+
+    def test_data_pool_invalidates(self):
+        """data_pools/下新增文件时key变化"""
+        before = self._key()
+        (self.scenario_dir / "data_pools" / "orders.json").write_text("[]")
+        self.assertNotEqual(self._key(), before)
+
+    def test_pycache_ignored(self):
+        """checkers/__pycache__ 不影响key"""
+        before = self._key()
+        (self.scenario_dir / "checkers" / "__pycache__").mkdir()
+        (self.scenario_dir / "checkers" / "__pycache__" / "rules.cpython-311.pyc").write_bytes(b"x")
+        self.assertEqual(self._key(), before)
+
+    def test_result_and_model_invalidate(self):
+        """Agent结果或Judge模型变化时key变化"""
+        deps = check_dependencies_digest(self.scenario_dir)
+        before = check_cache_key(self.checker, self.sample, self.result_file, "judge", deps)
+        self.assertNotEqual(check_cache_key(self.checker, self.sample, self.result_file, "other", deps), before)
+        self.result_file.write_text(json.dumps({"answer": 2}))
+        self.assertNotEqual(check_cache_key(self.checker, self.sample, self.result_file, "judge", deps), before)
+
+
+# 用标准库json.dump输出结果的checker（默认允许NaN）；未指定--output时打印到stdout
+_CHECKER_SCRIPT = """
+import argparse, json
+parser = argparse.ArgumentParser()
+for arg in ("--bench", "--result", "--output", "--model", "--base-url", "--api-key"):
+    parser.add_argument(arg)
+args = parser.parse_args()
+bench = json.load(open(args.bench))
+result = {"data_id": bench["data_id"], "overall_result": "Success", "score": float("nan"), "big": 2 ** 70}
+if args.output:
+    json.dump(result, open(args.output, "w"))
+else:
+    print(json.dumps(result))
+"""
+
+
+class TestCheckRunnerOutput(TempDirTestCase):
+    """测试checker输出的解析与标准库json一致"""
+
+    def setUp(self):
+        super().setUp()
+        self.checker = self.tmp_dir / "checker.py"
+        self.checker.write_text(_CHECKER_SCRIPT)
+        self.result_file = self.tmp_dir / "result.json"
+        self.result_file.write_text("{}")
+        self.runner = CheckRunner(self.checker, work_dir=self.tmp_dir, model="judge", base_url="http://judge")
+
+    def _assert_result(self, result: dict):
+        self.assertEqual(result["overall_result"], "Success")
+        self.assertTrue(math.isnan(result["score"]))
+        self.assertEqual(result["big"], 2 ** 70)
+
+    def test_nan_score_in_output_file(self):
+        """output文件中的NaN和超出64位的整数正常解析"""
+        output_file = self.tmp_dir / "check.json"
+        result = self.runner.run(bench_obj={"data_id": "s1"}, result_file=self.result_file, output_file=output_file)
+        self._assert_result(result)
+
+    def test_nan_score_on_stdout(self):
+        """只在stdout打印结果的checker同样解析"""
+        self._assert_result(self.runner.run(bench_obj={"data_id": "s1"}, result_file=self.result_file))
+
+    def test_loads_json_matches_stdlib(self):
+        """loads_json与json.loads结果一致，orjson能处理的内容照常解析"""
+        self.assertEqual(loads_json(b'{"a": [1, "x"]}'), {"a": [1, "x"]})
+        self.assertEqual(loads_json(b'{"n": -9223372036854775809}'), {"n": -9223372036854775809})
+        self.assertEqual(loads_json(b'{"inf": Infinity}'), {"inf": float("inf")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+"""
+评测器单元测试 - JSON读写与已完成检查清单（Resume模式）
+"""
+import json
+import math
+import unittest
+
+from benchkit.evaluator import COMPLETED_MANIFEST, get_completed_checks, iter_jsonl, write_case_result
+from testutils import TempDirTestCase
+
+
+class TestCompletedChecks(TempDirTestCase):
+    """测试已完成清单的读取"""
+
+    def setUp(self):
+        super().setUp()
+        self.output_dir = self.tmp_dir
+        self.cases_dir = self.output_dir / "cases"
+        self.cases_dir.mkdir()
+
+    def _write_case(self, data_id):
+        write_case_result(self.cases_dir / f"check_{data_id}.json", {"data_id": data_id})
+
+    def test_manifest_round_trip(self):
+        """写入的检查结果都记入清单"""
+        self._write_case("a")
+        self._write_case(7)
+        self.assertEqual(get_completed_checks(self.output_dir), {"a", 7})
+
+    def test_truncated_line_skipped(self):
+        """进程中断留下的半行被跳过，其余记录照常读取"""
+        self._write_case("a")
+        with open(self.cases_dir / COMPLETED_MANIFEST, "a", encoding="utf-8") as f:
+            f.write('"b')
+        self.assertEqual(get_completed_checks(self.output_dir), {"a"})
+
+    def test_append_after_truncated_line(self):
+        """半行之后追加的记录单独成行，不会因粘连而丢失"""
+        self._write_case("a")
+        with open(self.cases_dir / COMPLETED_MANIFEST, "a", encoding="utf-8") as f:
+            f.write('"b')
+        self._write_case("c")
+        self.assertEqual(get_completed_checks(self.output_dir), {"a", "c"})
+
+    def test_first_append_builds_manifest_for_old_output(self):
+        """旧输出目录（没有清单）上第一次写入结果时补建清单，之前的检查不丢失"""
+        (self.cases_dir / "check_old.json").write_text('{"data_id": "old"}')
+        self._write_case("new")
+        self.assertEqual(get_completed_checks(self.output_dir), {"old", "new"})
+
+    def test_missing_check_file_not_completed(self):
+        """清单中有记录但检查结果文件已删除的样本需要重新检查"""
+        self._write_case("a")
+        self._write_case("b")
+        (self.cases_dir / "check_b.json").unlink()
+        self.assertEqual(get_completed_checks(self.output_dir), {"a"})
+
+    def test_manifest_rebuilt_for_old_output(self):
+        """没有清单的旧输出目录从 check_*.json 补建清单"""
+        (self.cases_dir / "check_a.json").write_text('{"data_id": "a"}')
+        (self.cases_dir / "check_bad.json").write_text("{")
+        self.assertEqual(get_completed_checks(self.output_dir), {"a"})
+        self.assertTrue((self.cases_dir / COMPLETED_MANIFEST).exists())
+
+    def test_no_cases_dir(self):
+        """输出目录不存在cases时没有已完成的样本"""
+        self.assertEqual(get_completed_checks(self.output_dir / "missing"), set())
+
+
+class TestJsonCompat(TempDirTestCase):
+    """测试样本与检查结果的读写与标准库json一致"""
+
+    def test_iter_jsonl_accepts_stdlib_json(self):
+        """json.dump能写出的NaN、超出64位的整数都能读回"""
+        path = self.tmp_dir / "eval.jsonl"
+        path.write_text('{"data_id": "a", "score": NaN}\n\n{"data_id": "b", "n": 1180591620717411303424}\n')
+        items = list(iter_jsonl(path))
+        self.assertTrue(math.isnan(items[0]["score"]))
+        self.assertEqual(items[1]["n"], 2 ** 70)
+
+    def test_write_case_result_keeps_values(self):
+        """检查结果中的NaN、大整数原样写出"""
+        (self.tmp_dir / "cases").mkdir()
+        out_path = self.tmp_dir / "cases" / "check_a.json"
+        write_case_result(out_path, {"data_id": "a", "score": float("nan"), "n": 2 ** 70})
+        res = json.loads(out_path.read_text(encoding="utf-8"))
+        self.assertTrue(math.isnan(res["score"]))
+        self.assertEqual(res["n"], 2 ** 70)
+        self.assertEqual(get_completed_checks(self.tmp_dir), {"a"})
+
+
+if __name__ == "__main__":
+    unittest.main()
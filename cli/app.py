@@ -23,6 +23,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 from cli.terminal_ui import TerminalUI, ui
 from orchestrator import Orchestrator, AgentPhase
 from agents import InitAgent, ExecuteAgent
+from agents.base_agent import _preview_input
 
 
 class SynthesisCLI:
@@ -253,11 +254,8 @@ Example:
                                 tool_name = block.get("name", "unknown")
                                 tool_input = block.get("input", {})
 
-                                # 格式化参数
-                                import json
-                                params_str = json.dumps(tool_input, ensure_ascii=False)
-                                if len(params_str) > 50:
-                                    params_str = params_str[:50] + "..."
+                                # 格式化参数（先截断长字符串参数再序列化，不序列化完整文件内容）
+                                params_str = _preview_input(tool_input, 50)
 
                                 tool_calls.append(f"{tool_name}({params_str})")
 
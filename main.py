@@ -4,6 +4,7 @@ Auto Synthesis System - CLI入口
 Agent自动样本合成系统的命令行界面
 """
 import argparse
+import logging
 import sys
 from pathlib import Path
 
@@ -64,8 +65,18 @@ def main():
         help="Checkpoint目录 (默认: checkpoints)"
     )
 
+    parser.add_argument(
+        "--log-level",
+        default=None,
+        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+        help="logs/agent.log 的日志级别 (默认: 环境变量 AGENT_LOG_LEVEL，未设置时为 DEBUG)"
+    )
+
     args = parser.parse_args()
 
+    if args.log_level:
+        logging.getLogger("agents.base_agent").setLevel(args.log_level)
+
     if not args.requirement and not args.test and not args.resume:
         parser.print_help()
         sys.exit(1)
@@ -101,24 +112,27 @@ def main():
             model=args.model
         )
 
-        # 恢复orchestrator
-        orchestrator = Orchestrator.resume(
-            agent=agent,
-            work_dir=str(work_dir),
-            checkpoint_dir=args.checkpoint_dir
-        )
-
-        if orchestrator is None:
-            print("错误：没有找到可用的checkpoint")
-            sys.exit(1)
-
-        # 如果提供了新的需求，继续执行
-        if args.requirement:
-            result = orchestrator.continue_with_input(args.requirement)
-        else:
-            # 只显示状态
-            print("\nCheckpoint已恢复，可以使用 continue_with_input() 继续")
-            result = orchestrator._build_final_result()
+        try:
+            # 恢复orchestrator
+            orchestrator = Orchestrator.resume(
+                agent=agent,
+                work_dir=str(work_dir),
+                checkpoint_dir=args.checkpoint_dir
+            )
+
+            if orchestrator is None:
+                print("错误：没有找到可用的checkpoint")
+                sys.exit(1)
+
+            # 如果提供了新的需求，继续执行
+            if args.requirement:
+                result = orchestrator.continue_with_input(args.requirement)
+            else:
+                # 只显示状态
+                print("\nCheckpoint已恢复，可以使用 continue_with_input() 继续")
+                result = orchestrator._build_final_result()
+        finally:
+            agent.close()
 
     else:
         # 使用真实Agent
@@ -135,13 +149,16 @@ def main():
             model=args.model
         )
 
-        orchestrator = Orchestrator(
-            agent=agent,
-            work_dir=str(work_dir),
-            checkpoint_dir=args.checkpoint_dir
-        )
+        try:
+            orchestrator = Orchestrator(
+                agent=agent,
+                work_dir=str(work_dir),
+                checkpoint_dir=args.checkpoint_dir
+            )
 
-        result = orchestrator.run(args.requirement)
+            result = orchestrator.run(args.requirement)
+        finally:
+            agent.close()
 
     # 输出结果
     print("\n" + "="*60)
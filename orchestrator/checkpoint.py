@@ -6,7 +6,9 @@ import os
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import asdict, dataclass
+
+import orjson
 
 
 @dataclass
@@ -47,6 +49,8 @@ class CheckpointManager:
         self.checkpoint_dir = Path(checkpoint_dir)
         self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
         self._current_checkpoint_id: Optional[str] = None
+        # 已序列化的Agent对话历史（配合Agent的写出游标增量追加）
+        self._serialized_messages: list = []
 
     def _generate_id(self) -> str:
         """生成 checkpoint ID"""
@@ -96,6 +100,22 @@ class CheckpointManager:
 
         return serialized
 
+    def _serialize_agent_messages(self, agent):
+        """
+        序列化Agent的对话历史
+
+        Agent提供写出游标时只序列化新增的尾部消息；游标归零（新对话/Compact）时整体重建
+        """
+        if not hasattr(agent, 'get_new_history_since_cursor'):
+            return self._serialize_messages(agent._conversation_history)
+
+        new_messages = agent.get_new_history_since_cursor()
+        if agent.history_write_cursor == 0:
+            self._serialized_messages = []
+        self._serialized_messages.extend(self._serialize_messages(new_messages) or [])
+        agent.advance_history_cursor()
+        return self._serialized_messages or None
+
     def save(self, orchestrator, force_new: bool = False) -> str:
         """
         保存 checkpoint
@@ -115,7 +135,7 @@ class CheckpointManager:
         agent_state = None
 
         if orchestrator.agent and hasattr(orchestrator.agent, '_conversation_history'):
-            agent_messages = self._serialize_messages(orchestrator.agent._conversation_history)
+            agent_messages = self._serialize_agent_messages(orchestrator.agent)
 
             # 保存Agent的内部状态（通用，从ExecuteAgent继承）
             agent_state = {
@@ -133,15 +153,21 @@ class CheckpointManager:
             agent_state=agent_state,
         )
 
+        # 序列化一次（orjson直接处理dataclass，输出UTF-8字节），两个文件共用
+        # 缩进与分隔符和json.dump(indent=2)的输出不完全相同，load用json读取不受影响；
+        # orjson不支持的值（如超出64位的整数）退回json.dumps
+        try:
+            payload = orjson.dumps(checkpoint, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            payload = json.dumps(asdict(checkpoint), ensure_ascii=False, indent=2).encode("utf-8")
+
         # 保存到文件
         filepath = self.checkpoint_dir / f"{self._current_checkpoint_id}.json"
-        with open(filepath, "w", encoding="utf-8") as f:
-            json.dump(asdict(checkpoint), f, ensure_ascii=False, indent=2)
+        filepath.write_bytes(payload)
 
         # 同时保存为 latest
         latest_path = self.checkpoint_dir / "latest.json"
-        with open(latest_path, "w", encoding="utf-8") as f:
-            json.dump(asdict(checkpoint), f, ensure_ascii=False, indent=2)
+        latest_path.write_bytes(payload)
 
         return self._current_checkpoint_id
 
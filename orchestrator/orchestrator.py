@@ -17,6 +17,8 @@ from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 
+from .checkpoint import CheckpointManager
+
 
 @dataclass
 class AgentResult:
@@ -63,7 +65,6 @@ class Orchestrator:
         self.iterations = 0
 
         # Checkpoint 管理
-        from .checkpoint import CheckpointManager
         self.checkpoint_manager = CheckpointManager(checkpoint_dir)
         self.auto_checkpoint = auto_checkpoint
 
@@ -94,8 +95,6 @@ class Orchestrator:
         Returns:
             恢复的 Orchestrator 实例，或 None（如果没有 checkpoint）
         """
-        from .checkpoint import CheckpointManager
-
         manager = CheckpointManager(checkpoint_dir)
         checkpoint = manager.load(checkpoint_id)
 
@@ -0,0 +1,16 @@
+"""
+单元测试公共设施
+"""
+import tempfile
+import unittest
+from pathlib import Path
+
+
+class TempDirTestCase(unittest.TestCase):
+    """每个测试使用独立的临时目录 self.tmp_dir，测试结束后删除（测试失败也不会在工作目录残留输出）"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        # addCleanup在tearDown之后执行：子类tearDown中关闭的进程/Agent不会再占用目录
+        self.addCleanup(tmp.cleanup)
+        self.tmp_dir = Path(tmp.name)
@@ -6,21 +6,26 @@
 - FileWriter: 文件写入
 - FileEditor: 文件编辑（字符串替换/行范围）
 - BashExecutor: Shell命令执行（安全受限）
+- PersistentBash: 常驻bash进程的Shell命令执行
 - UseSkill: 技能库资源获取
 - AskHuman: 人机交互（HITL）
+- ObservationStore: 大段工具输出归档与按需读取
 """
 
 from .file_tools import FileReader, FileWriter, FileEditor
-from .bash_executor import BashExecutor
+from .bash_executor import BashExecutor, PersistentBash
 from .skill_tools import UseSkill, SkillFileReader
 from .hitl_tools import AskHuman
+from .observation_store import ObservationStore
 
 __all__ = [
     "FileReader",
     "FileWriter",
     "FileEditor",
     "BashExecutor",
+    "PersistentBash",
     "UseSkill",
     "SkillFileReader",
     "AskHuman",
+    "ObservationStore",
 ]
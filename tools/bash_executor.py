@@ -5,8 +5,13 @@ Shell执行工具 - 基于Wenning实现适配
 """
 import os
 import re
+import selectors
+import shlex
+import signal
 import subprocess
+import threading
 import time
+import uuid
 from pathlib import Path
 from typing import Dict, Any, Optional, Set
 
@@ -66,8 +71,93 @@ class BashExecutor:
 
         return None
 
-    def execute(self, command: str, timeout: int = None) -> Dict[str, Any]:
-        """执行shell命令"""
+    # 管道每次读取的块大小
+    READ_CHUNK_SIZE = 65536
+    # bash退出后等待读线程读完剩余输出的秒数
+    READER_GRACE_SECONDS = 0.5
+
+    @classmethod
+    def _drain_pipe(cls, pipe, limit: Optional[int], sink: Dict[str, Any]):
+        """
+        读取管道直到EOF，只保留前limit字节，超出部分只计数丢弃
+
+        边读边写入sink：后台进程持有管道时读线程不会结束，调用方可直接取已读到的部分
+        """
+        buffer = sink["data"] = bytearray()
+        sink["dropped"] = 0
+        while True:
+            chunk = pipe.read1(cls.READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            if limit is None:
+                buffer += chunk
+                continue
+            room = limit - len(buffer)
+            if room > 0:
+                buffer += chunk[:room]
+            sink["dropped"] += max(len(chunk) - max(room, 0), 0)
+        pipe.close()
+
+    def _run(
+        self,
+        cmd: str,
+        timeout: int,
+        max_stdout_bytes: Optional[int],
+        max_stderr_bytes: Optional[int],
+        stdout_sink: Dict[str, Any],
+        stderr_sink: Dict[str, Any]
+    ) -> int:
+        """
+        启动bash执行命令，输出写入sink，返回退出码（超时抛出TimeoutExpired）
+
+        命令在独立进程组中运行，超时时整组杀掉。bash退出后读线程最多再等 READER_GRACE_SECONDS 秒：
+        后台进程（如 `server &`）仍占着管道时返回已读到的输出，并在sink中标记 abandoned
+        （读线程随后台进程的管道关闭而结束）
+        """
+        deadline = time.monotonic() + timeout
+        process = subprocess.Popen(
+            ["bash", "-c", cmd],
+            cwd=str(self.work_dir),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env={**os.environ},
+            start_new_session=True
+        )
+        readers = [
+            threading.Thread(target=self._drain_pipe, args=(process.stdout, max_stdout_bytes, stdout_sink), daemon=True),
+            threading.Thread(target=self._drain_pipe, args=(process.stderr, max_stderr_bytes, stderr_sink), daemon=True),
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            returncode = process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+            raise
+        grace_deadline = min(deadline, time.monotonic() + self.READER_GRACE_SECONDS)
+        for reader, sink in zip(readers, (stdout_sink, stderr_sink)):
+            reader.join(max(grace_deadline - time.monotonic(), 0))
+            if reader.is_alive():
+                sink["abandoned"] = True
+        return returncode
+
+    def execute(
+        self,
+        command: str,
+        timeout: int = None,
+        max_stdout_bytes: Optional[int] = None,
+        max_stderr_bytes: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        执行shell命令
+
+        max_stdout_bytes/max_stderr_bytes: 输出在读取时即截断，超出部分不进入内存，
+        被丢弃的字节数记录在 stdout_dropped/stderr_dropped 中
+        """
         if not command or not command.strip():
             return {"error": "缺少command参数"}
 
@@ -79,23 +169,19 @@ class BashExecutor:
         if danger:
             return {"error": f"命令包含受限模式: {danger}"}
 
-        # 记录执行前的文件
+        # 记录执行前的文件（scandir的文件类型来自目录项本身，不需要逐个stat）
         try:
-            pre_files: Set[str] = {p.name for p in self.work_dir.iterdir() if p.is_file()}
+            with os.scandir(self.work_dir) as entries:
+                pre_files: Set[str] = {entry.name for entry in entries if entry.is_file()}
         except Exception:
             pre_files = set()
 
         start_ns = time.time_ns()
 
+        stdout_sink: Dict[str, Any] = {}
+        stderr_sink: Dict[str, Any] = {}
         try:
-            result = subprocess.run(
-                ["bash", "-c", cmd],
-                cwd=str(self.work_dir),
-                capture_output=True,
-                text=True,
-                timeout=timeout,
-                env={**os.environ}
-            )
+            returncode = self._run(cmd, timeout, max_stdout_bytes, max_stderr_bytes, stdout_sink, stderr_sink)
         except subprocess.TimeoutExpired:
             return {"error": f"命令执行超时（限制{timeout}s）"}
         except Exception as e:
@@ -103,23 +189,171 @@ class BashExecutor:
 
         # 检测新生成的文件
         try:
-            post_paths = [p for p in self.work_dir.iterdir() if p.is_file()]
-            post_files = {p.name for p in post_paths}
-            # 新文件 = 执行后存在但执行前不存在
-            new_files_set = post_files - pre_files
-            # 修改过的文件 = 修改时间在执行开始之后
-            changed = [
-                p.name for p in post_paths
-                if getattr(p.stat(), 'st_mtime_ns', int(p.stat().st_mtime * 1e9)) >= (start_ns - 5_000_000)
-            ]
-            generated_files = sorted(list({*new_files_set, *set(changed)}))
+            # 生成的文件 = 执行前不存在的新文件 + 修改时间在执行开始之后的文件
+            # 单次遍历直接筛选，不建中间列表；新文件不需要stat
+            changed_since = start_ns - 5_000_000
+            with os.scandir(self.work_dir) as entries:
+                generated_files = sorted(
+                    entry.name for entry in entries
+                    if entry.is_file()
+                    and (entry.name not in pre_files or entry.stat().st_mtime_ns >= changed_since)
+                )
         except Exception:
             generated_files = []
 
-        return {
-            "stdout": result.stdout,
-            "stderr": result.stderr,
-            "returncode": result.returncode,
+        result = {
+            "stdout": bytes(stdout_sink.get("data", b"")).decode("utf-8", errors="replace"),
+            "stderr": bytes(stderr_sink.get("data", b"")).decode("utf-8", errors="replace"),
+            "returncode": returncode,
             "work_dir": str(self.work_dir),
             "generated_files": generated_files
         }
+        if stdout_sink.get("dropped"):
+            result["stdout_dropped"] = stdout_sink["dropped"]
+        if stderr_sink.get("dropped"):
+            result["stderr_dropped"] = stderr_sink["dropped"]
+        if stdout_sink.get("abandoned") or stderr_sink.get("abandoned"):
+            result["note"] = "后台进程仍持有输出管道，只返回了命令退出时已读到的输出（后台进程的输出请重定向到文件）"
+        return result
+
+
+class _MarkedStream:
+    """从常驻shell的管道中截取一条命令的输出（读到结束标记所在行为止），只保留前limit字节"""
+
+    def __init__(self, marker: bytes, limit: Optional[int], sink: Dict[str, Any]):
+        self.marker = marker
+        self.limit = limit
+        self.sink = sink
+        self._buffer = bytearray()
+        self._dropped = 0
+        # 尚未确认不属于标记的尾部字节（标记可能跨两次读取）
+        self._pending = b""
+        # 标记之后、换行之前的内容（stdout中为退出码）
+        self._after: Optional[bytes] = None
+
+    def _keep(self, data: bytes):
+        if self.limit is None:
+            self._buffer += data
+            return
+        room = self.limit - len(self._buffer)
+        if room > 0:
+            self._buffer += data[:room]
+        self._dropped += max(len(data) - max(room, 0), 0)
+
+    def feed(self, chunk: bytes) -> bool:
+        """处理读到的数据，读到完整的标记行时返回True"""
+        if self._after is None:
+            data = self._pending + chunk
+            idx = data.find(self.marker)
+            if idx < 0:
+                hold = len(self.marker) - 1
+                self._keep(data[:-hold])
+                self._pending = data[-hold:]
+                return False
+            self._keep(data[:idx])
+            self._pending = b""
+            self._after = data[idx + len(self.marker):]
+        else:
+            self._after += chunk
+
+        if b"\n" not in self._after:
+            return False
+        self.sink["data"] = bytes(self._buffer)
+        self.sink["dropped"] = self._dropped
+        self.sink["tail"] = self._after.split(b"\n", 1)[0]
+        return True
+
+
+class PersistentBash(BashExecutor):
+    """
+    常驻bash进程的Shell执行工具
+
+    每个场景只启动一个bash子进程，命令通过stdin送入、在子shell中执行（cd、exit等不影响后续命令），
+    输出以随机结束标记分隔，省去每次调用fork+exec bash的开销。
+    超时或shell异常退出时杀掉整个进程组，下次调用时重新启动。
+
+    后台任务（`cmd &`）会继承常驻shell的管道，之后的输出会混进下一条命令，
+    因此含后台任务的命令不走常驻shell，改为单独启动bash执行（见 BashExecutor._run）。
+    """
+
+    # 后台任务的 &（排除 &&、>&、&>、<&、|&）
+    _BACKGROUND_RE = re.compile(r"(?<![&>|<])&(?![&>])")
+
+    def __init__(self, work_dir: Path, timeout: int = 120):
+        super().__init__(work_dir=work_dir, timeout=timeout)
+        self._marker = f"__bash_done_{uuid.uuid4().hex}__".encode()
+        self._process: Optional[subprocess.Popen] = None
+
+    def _ensure_shell(self) -> subprocess.Popen:
+        """返回存活的bash进程，不存在或已退出时启动新的"""
+        if self._process is None or self._process.poll() is not None:
+            self.close()
+            self._process = subprocess.Popen(
+                ["bash", "--noprofile", "--norc"],
+                cwd=str(self.work_dir),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                env={**os.environ},
+                start_new_session=True
+            )
+        return self._process
+
+    def close(self):
+        """结束bash进程及其启动的所有子进程"""
+        process = self._process
+        if process is None:
+            return
+        self._process = None
+        if process.poll() is None:
+            os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        for pipe in (process.stdin, process.stdout, process.stderr):
+            pipe.close()
+
+    def _run(
+        self,
+        cmd: str,
+        timeout: int,
+        max_stdout_bytes: Optional[int],
+        max_stderr_bytes: Optional[int],
+        stdout_sink: Dict[str, Any],
+        stderr_sink: Dict[str, Any]
+    ) -> int:
+        """在常驻bash中执行命令，读取两个管道直到各自的结束标记"""
+        if self._BACKGROUND_RE.search(cmd):
+            return super()._run(cmd, timeout, max_stdout_bytes, max_stderr_bytes, stdout_sink, stderr_sink)
+        process = self._ensure_shell()
+        marker = self._marker.decode()
+        # 命令整体作为单引号字符串交给eval：引号不配对等语法错误只影响这一条命令，不会让shell等待更多输入
+        script = (
+            f"( eval {shlex.quote(cmd)} ) </dev/null\n"
+            f"printf '%s%d\\n' {marker} $?\n"
+            f"printf '%s\\n' {marker} >&2\n"
+        )
+        streams = {
+            process.stdout.fileno(): _MarkedStream(self._marker, max_stdout_bytes, stdout_sink),
+            process.stderr.fileno(): _MarkedStream(self._marker, max_stderr_bytes, stderr_sink),
+        }
+        deadline = time.monotonic() + timeout
+        try:
+            process.stdin.write(script.encode("utf-8"))
+            process.stdin.flush()
+            with selectors.DefaultSelector() as selector:
+                for fd in streams:
+                    selector.register(fd, selectors.EVENT_READ)
+                while selector.get_map():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise subprocess.TimeoutExpired(cmd, timeout)
+                    for key, _ in selector.select(remaining):
+                        chunk = os.read(key.fd, self.READ_CHUNK_SIZE)
+                        if not chunk:
+                            raise RuntimeError("bash进程意外退出")
+                        if streams[key.fd].feed(chunk):
+                            selector.unregister(key.fd)
+        except BaseException:
+            # 命令可能还在运行或shell状态未知，整体重启
+            self.close()
+            raise
+        return int(stdout_sink["tail"])
@@ -6,11 +6,29 @@
 import json
 import csv
 import mimetypes
+import os
+import threading
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import difflib
 
 
+@lru_cache(maxsize=512)
+def _parse_path(base_dir: Path, filename: str) -> Tuple[Path, bool, bool]:
+    """
+    解析工具传入的文件名
+
+    Returns:
+        (目标路径, 是否绝对路径, 是否包含'..')
+        Agent会反复读写同一批文件，按(base_dir, filename)缓存，避免重复构造Path
+    """
+    p = Path(filename)
+    if p.is_absolute():
+        return p, True, ".." in p.parts
+    return base_dir / filename, False, ".." in p.parts
+
+
 class FileReader:
     """文件读取工具 - 支持多种格式"""
 
@@ -22,17 +40,17 @@ class FileReader:
 
     def _safe_path(self, filename: str) -> Path:
         """安全路径检查：支持相对路径和绝对路径"""
-        p = Path(filename)
+        path, is_absolute, has_parent_ref = _parse_path(self.base_dir, filename)
 
         # 绝对路径直接使用
-        if p.is_absolute():
-            return p
+        if is_absolute:
+            return path
 
         # 检查路径穿越
-        if ".." in p.parts:
+        if has_parent_ref:
             raise ValueError("不允许使用'..'进行路径穿越")
 
-        return self.base_dir / filename
+        return path
 
     def _infer_mode(self, filename: str) -> str:
         """自动推断文件类型"""
@@ -52,13 +70,27 @@ class FileReader:
         return "text"  # 默认文本
 
     def _read_text(self, path: Path, encoding: str, max_bytes: int, max_lines: int) -> Dict[str, Any]:
-        """读取文本文件"""
-        data = path.open("rb").read(max_bytes)
-        text = data.decode(encoding, errors="replace")
-        lines = text.splitlines()
-        truncated = path.stat().st_size > len(data) or len(lines) > max_lines
+        """读取文本文件（在字节层面定位第max_lines个换行，只解码需要的部分）"""
+        with path.open("rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            data = f.read(max_bytes)
+
+        # bytes.find逐个定位换行（C实现），超出max_lines的部分不解码、不切分
+        cut = len(data)
+        pos = 0
+        for _ in range(max_lines):
+            pos = data.find(b"\n", pos) + 1
+            if not pos:
+                break
+        else:
+            cut = pos
+        truncated = size > len(data) or cut < len(data)
+
+        lines = data[:cut].decode(encoding, errors="replace").splitlines()
+        # 按\n以外的换行符（如单独的\r）切分出的行仍按max_lines截断
         if len(lines) > max_lines:
             lines = lines[:max_lines]
+            truncated = True
         return {"content": "\n".join(lines), "truncated": truncated}
 
     def _read_json(self, path: Path, encoding: str, max_bytes: int) -> Dict[str, Any]:
@@ -132,45 +164,102 @@ class FileReader:
 
 
 class FileWriter:
-    """文件写入工具"""
+    """
+    文件写入工具
+
+    最后一次写入先保存在内存中，写入其他文件或调用flush()时才原子落盘，
+    同一文件被连续重写（如反复生成samples/eval.jsonl）时只写一次磁盘。
+    调用方需在其他工具读取文件前、以及每轮工具调用结束时调用flush()。
+    目标路径在execute时即检查（父目录可创建、不是目录），flush仍失败时抛出OSError。
+    """
 
     name = "file_writer"
     description = "创建新文件或覆盖已有文件"
 
     def __init__(self, base_dir: Path):
         self.base_dir = base_dir
+        # 尚未落盘的写入: 目标路径 -> 编码后的内容（最多一个文件）
+        self._pending: Dict[Path, bytes] = {}
+        # 并发执行的只读工具可能同时触发flush，与execute共用（execute内会调用flush，需可重入）
+        self._lock = threading.RLock()
 
     def _safe_path(self, filename: str) -> Path:
         """安全路径检查"""
-        p = Path(filename)
-        if p.is_absolute() or ".." in p.parts:
+        path, is_absolute, has_parent_ref = _parse_path(self.base_dir, filename)
+        if is_absolute or has_parent_ref:
             raise ValueError("仅允许相对路径，不允许绝对路径或'..'")
-        return self.base_dir / filename
+        return path
 
     def execute(self, filename: str, content: str, encoding: str = "utf-8",
                 overwrite: bool = True) -> Dict[str, Any]:
-        """执行文件写入"""
+        """执行文件写入（内容暂存，写入其他文件或flush时落盘）"""
         path = self._safe_path(filename)
+        data = content.encode(encoding)
+
+        with self._lock:
+            # 检查是否已存在
+            existed = path in self._pending or path.exists()
+            if existed and not overwrite:
+                return {"error": f"文件已存在: {filename}，设置overwrite=true可覆盖"}
+            if path.is_dir():
+                return {"error": f"目标是目录: {filename}"}
+
+            # 写入其他文件前，先把上一个文件落盘；上一个文件落盘失败单独报告，不影响本次写入
+            previous_error = None
+            if path not in self._pending:
+                try:
+                    self.flush()
+                except OSError as e:
+                    previous_error = str(e)
 
-        # 检查是否已存在
-        existed = path.exists()
-        if existed and not overwrite:
-            return {"error": f"文件已存在: {filename}，设置overwrite=true可覆盖"}
-
-        # 确保目录存在
-        path.parent.mkdir(parents=True, exist_ok=True)
+            # 确保目录存在（目录问题在写入时就暴露，而不是推迟到flush）
+            try:
+                path.parent.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                error = {"error": f"无法创建目录 {path.parent}: {e}"}
+                if previous_error:
+                    error["previous_write_error"] = previous_error
+                return error
 
-        # 写入文件
-        path.write_text(content, encoding=encoding)
+            self._pending[path] = data
 
-        return {
+        result = {
             "success": True,
             "filename": filename,
             "path": str(path),
-            "file_size": path.stat().st_size,
+            "file_size": len(data),
             "lines": content.count('\n') + 1 if content else 0,
             "action": "overwritten" if existed else "created"
         }
+        if previous_error:
+            result["previous_write_error"] = previous_error
+        return result
+
+    def flush(self):
+        """
+        将暂存的写入原子落盘（先写临时文件再os.replace）
+
+        落盘失败的文件从暂存中丢弃（不会在之后每次flush时重复失败），处理完后抛出OSError
+        """
+        with self._lock:
+            failed = []
+            while self._pending:
+                path, data = self._pending.popitem()
+                tmp_path = path.with_name(f".{path.name}.tmp")
+                try:
+                    tmp_path.write_bytes(data)
+                    # 覆盖已有文件时保留原权限（如可执行脚本）
+                    if path.exists():
+                        os.chmod(tmp_path, path.stat().st_mode)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    failed.append(f"{path}: {e}")
+                    try:
+                        tmp_path.unlink(missing_ok=True)
+                    except OSError:
+                        pass
+            if failed:
+                raise OSError(f"暂存的写入落盘失败: {'; '.join(failed)}")
 
 
 class FileEditor:
@@ -184,10 +273,10 @@ class FileEditor:
 
     def _safe_path(self, filename: str) -> Path:
         """安全路径检查"""
-        p = Path(filename)
-        if p.is_absolute() or ".." in p.parts:
+        path, is_absolute, has_parent_ref = _parse_path(self.base_dir, filename)
+        if is_absolute or has_parent_ref:
             raise ValueError("仅允许相对路径")
-        return self.base_dir / filename
+        return path
 
     def execute_replace(self, filename: str, old_string: str, new_string: str,
                        replace_all: bool = False, encoding: str = "utf-8") -> Dict[str, Any]:
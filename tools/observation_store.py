@@ -0,0 +1,71 @@
+"""
+观察结果归档工具 - 大段工具输出落盘，上下文中只保留预览和引用
+"""
+import hashlib
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Any
+
+
+@lru_cache(maxsize=64)
+def _load_observation(path: str) -> str:
+    """读取归档内容（按内容寻址，文件写入后不变，可直接缓存）"""
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+class ObservationStore:
+    """观察结果归档（按内容哈希寻址）"""
+
+    name = "fetch_observation"
+    description = (
+        "读取被归档的大段工具输出。"
+        "当工具结果中出现 obs:// 引用（如bash的stdout_ref）且预览不足以判断时调用，可按offset/limit分段读取。"
+    )
+
+    REF_PREFIX = "obs://"
+
+    def __init__(self, base_dir: Path):
+        self.base_dir = base_dir
+
+    def _path_for(self, digest: str) -> Path:
+        return self.base_dir / f"{digest}.txt"
+
+    def stash(self, payload: str) -> str:
+        """
+        归档内容，返回 obs://<hash> 引用
+
+        先写临时文件再 os.replace，保证读到的归档文件总是完整的
+        """
+        digest = hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+        path = self._path_for(digest)
+        if not path.exists():
+            self.base_dir.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.base_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        return f"{self.REF_PREFIX}{digest}"
+
+    def execute(self, ref: str, offset: int = 0, limit: int = 20000) -> Dict[str, Any]:
+        """按引用读取归档内容（offset/limit按字符计）"""
+        digest = ref[len(self.REF_PREFIX):] if ref.startswith(self.REF_PREFIX) else ref
+        if not digest.isalnum():
+            return {"error": f"无效的引用: {ref}"}
+
+        path = self._path_for(digest)
+        if not path.exists():
+            return {"error": f"归档不存在: {ref}"}
+
+        content = _load_observation(str(path))
+        offset = max(offset, 0)
+        chunk = content[offset:offset + limit]
+        return {
+            "ref": f"{self.REF_PREFIX}{digest}",
+            "offset": offset,
+            "total_chars": len(content),
+            "has_more": offset + len(chunk) < len(content),
+            "content": chunk,
+        }
@@ -2,8 +2,9 @@
 技能库工具 - 获取SOP、模板、最佳实践
 """
 import json
+import os
 from pathlib import Path
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
 
 
 class UseSkill:
@@ -44,8 +45,23 @@ Execute Agent专用：
         "execute_to_init_context": "execute_to_init_context",
     }
 
+    # 技能目录下的子资源目录
+    RESOURCE_SUBDIRS = ("templates", "examples", "sop", "references")
+
     def __init__(self, skills_dir: Path):
         self.skills_dir = skills_dir
+        # 技能结果缓存: skill_type -> (文件签名, 结果)
+        self._cache: Dict[str, Tuple[Tuple[Optional[int], ...], Dict[str, Any]]] = {}
+
+    def _signature(self, skill_path: Path) -> Tuple[Optional[int], ...]:
+        """SKILL.md和各子资源目录的mtime（增删文件、修改SKILL.md都会改变签名）"""
+        signature = []
+        for path in (skill_path / "SKILL.md", *(skill_path / d for d in self.RESOURCE_SUBDIRS)):
+            try:
+                signature.append(os.stat(path).st_mtime_ns)
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
 
     def list_skills(self) -> Dict[str, Any]:
         """列出所有可用技能"""
@@ -80,9 +96,15 @@ Execute Agent专用：
         if not skill_path.exists():
             return {"error": f"技能目录不存在: {skill_path}"}
 
+        # 文件未变化时直接复用上次的结果
+        signature = self._signature(skill_path)
+        cached = self._cache.get(skill_type)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
         # 读取SKILL.md作为主要内容
         skill_md = skill_path / "SKILL.md"
-        if skill_md.exists():
+        if signature[0] is not None:
             content = skill_md.read_text(encoding="utf-8")
         else:
             # 如果没有SKILL.md，列出目录下的文件
@@ -94,7 +116,7 @@ Execute Agent专用：
         available_resources: List[str] = []
         resource_files: Dict[str, List[str]] = {}
 
-        for subdir in ["templates", "examples", "sop", "references"]:
+        for subdir in self.RESOURCE_SUBDIRS:
             subpath = skill_path / subdir
             if subpath.exists():
                 available_resources.append(subdir)
@@ -103,7 +125,7 @@ Execute Agent专用：
                 if files_in_subdir:
                     resource_files[subdir] = files_in_subdir
 
-        return {
+        result = {
             "skill_type": skill_type,
             "skill_directory": skill_dir_name,
             "content": content,
@@ -111,6 +133,10 @@ Execute Agent专用：
             "resource_files": resource_files,
             "tip": f"使用file_reader读取具体文件，路径格式: skills/{skill_dir_name}/<subdir>/<filename>"
         }
+        # 没有SKILL.md时内容是递归文件列表，签名覆盖不到深层目录，不缓存
+        if signature[0] is not None:
+            self._cache[skill_type] = (signature, result)
+        return result
 
 
 class SkillFileReader:
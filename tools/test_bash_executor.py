@@ -0,0 +1,96 @@
+"""
+Shell执行工具单元测试 - 常驻bash的标记解析、超时与后台任务
+"""
+import time
+import unittest
+
+from testutils import TempDirTestCase
+from tools.bash_executor import BashExecutor, PersistentBash, _MarkedStream
+
+
+class TestMarkedStream(unittest.TestCase):
+    """测试结束标记的截取"""
+
+    MARKER = b"__bash_done_test__"
+
+    def test_marker_split_across_reads(self):
+        """标记被拆在多次读取中间时仍能识别，输出不含标记碎片"""
+        sink = {}
+        stream = _MarkedStream(self.MARKER, None, sink)
+        data = b"hello\n" + self.MARKER + b"0\n"
+        chunks = [data[i:i + 3] for i in range(0, len(data), 3)]
+        done = [stream.feed(chunk) for chunk in chunks]
+
+        self.assertEqual(done[:-1], [False] * (len(chunks) - 1))
+        self.assertTrue(done[-1])
+        self.assertEqual(sink["data"], b"hello\n")
+        self.assertEqual(sink["tail"], b"0")
+
+    def test_limit_counts_dropped_bytes(self):
+        """超出limit的输出只计数不保留"""
+        sink = {}
+        stream = _MarkedStream(self.MARKER, 4, sink)
+        self.assertTrue(stream.feed(b"abcdefgh" + self.MARKER + b"\n"))
+        self.assertEqual(sink["data"], b"abcd")
+        self.assertEqual(sink["dropped"], 4)
+
+
+class TestPersistentBash(TempDirTestCase):
+    """测试常驻bash"""
+
+    def setUp(self):
+        super().setUp()
+        self.bash = PersistentBash(work_dir=self.tmp_dir, timeout=10)
+
+    def tearDown(self):
+        self.bash.close()
+
+    def test_shell_is_reused(self):
+        """连续命令复用同一个bash进程，cd不影响后续命令"""
+        first = self.bash.execute("cd / && echo $$")
+        second = self.bash.execute("pwd; echo $$")
+        self.assertEqual(first["returncode"], 0)
+        lines = second["stdout"].split()
+        self.assertEqual(lines[0], str(self.tmp_dir.resolve()))
+        self.assertEqual(first["stdout"].strip(), lines[1])
+
+    def test_timeout_restarts_shell(self):
+        """超时后返回错误，下一条命令在新shell中正常执行"""
+        result = self.bash.execute("sleep 5", timeout=1)
+        self.assertIn("超时", result["error"])
+        result = self.bash.execute("echo ok")
+        self.assertEqual(result["stdout"], "ok\n")
+
+    def test_background_output_not_leaked(self):
+        """后台任务之后的输出不会混进下一条命令"""
+        start = time.monotonic()
+        self.bash.execute("(sleep 0.5; echo late) & echo started", timeout=30)
+        self.assertLess(time.monotonic() - start, 2)
+        time.sleep(1)
+        result = self.bash.execute("echo next")
+        self.assertEqual(result["stdout"], "next\n")
+
+    def test_background_holding_pipe_returns_promptly(self):
+        """后台任务占着管道时，bash退出后很快返回已读到的输出，不等到超时"""
+        start = time.monotonic()
+        result = self.bash.execute("echo started; sleep 5 &", timeout=30)
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertEqual(result["stdout"], "started\n")
+        self.assertEqual(result["returncode"], 0)
+        self.assertIn("note", result)
+
+
+class TestBashExecutor(TempDirTestCase):
+    """测试一次性bash执行"""
+
+    def test_timeout_kills_process_group(self):
+        """超时时整个进程组被杀掉，不等子进程结束"""
+        bash = BashExecutor(work_dir=self.tmp_dir, timeout=1)
+        start = time.monotonic()
+        result = bash.execute("sleep 5 | cat")
+        self.assertIn("超时", result["error"])
+        self.assertLess(time.monotonic() - start, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
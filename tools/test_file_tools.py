@@ -0,0 +1,66 @@
+"""
+文件工具单元测试 - FileWriter暂存写入与落盘
+"""
+import unittest
+
+from testutils import TempDirTestCase
+from tools.file_tools import FileWriter
+
+
+class TestFileWriter(TempDirTestCase):
+    """测试FileWriter"""
+
+    def setUp(self):
+        super().setUp()
+        self.base_dir = self.tmp_dir
+        self.writer = FileWriter(base_dir=self.base_dir)
+
+    def test_write_is_flushed_on_next_file(self):
+        """写入其他文件时上一个文件落盘，同一文件连续重写只保留最后一次"""
+        self.writer.execute("a.txt", "1")
+        self.writer.execute("a.txt", "2")
+        self.assertFalse((self.base_dir / "a.txt").exists())
+        self.writer.execute("sub/b.txt", "3")
+        self.assertEqual((self.base_dir / "a.txt").read_text(), "2")
+        self.writer.flush()
+        self.assertEqual((self.base_dir / "sub" / "b.txt").read_text(), "3")
+
+    def test_directory_target_rejected(self):
+        """目标是目录时在execute中直接报错，不暂存"""
+        (self.base_dir / "tools").mkdir()
+        result = self.writer.execute("tools", "x")
+        self.assertIn("error", result)
+        self.writer.flush()
+
+    def test_parent_is_file_rejected(self):
+        """父路径是文件时在execute中直接报错"""
+        (self.base_dir / "a.txt").write_text("x")
+        result = self.writer.execute("a.txt/b.txt", "y")
+        self.assertIn("error", result)
+
+    def test_flush_error_drops_entry(self):
+        """落盘失败时抛出OSError并丢弃该条写入，之后的flush不再重复失败"""
+        result = self.writer.execute("out/a.txt", "x")
+        self.assertTrue(result["success"])
+        # 落盘前目标被替换为目录
+        (self.base_dir / "out" / "a.txt").mkdir()
+
+        with self.assertRaises(OSError):
+            self.writer.flush()
+        self.assertEqual(list((self.base_dir / "out").iterdir()), [self.base_dir / "out" / "a.txt"])
+        self.writer.flush()
+
+    def test_previous_flush_error_reported_separately(self):
+        """上一个文件落盘失败时单独报告，本次写入照常暂存"""
+        self.writer.execute("out/a.txt", "x")
+        (self.base_dir / "out" / "a.txt").mkdir()
+
+        result = self.writer.execute("b.txt", "y")
+        self.assertTrue(result["success"])
+        self.assertIn("a.txt", result["previous_write_error"])
+        self.writer.flush()
+        self.assertEqual((self.base_dir / "b.txt").read_text(), "y")
+
+
+if __name__ == "__main__":
+    unittest.main()
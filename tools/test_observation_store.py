@@ -0,0 +1,44 @@
+"""
+观察结果归档单元测试 - 归档与分段读取
+"""
+import unittest
+
+from testutils import TempDirTestCase
+from tools.observation_store import ObservationStore
+
+
+class TestObservationStore(TempDirTestCase):
+    """测试ObservationStore"""
+
+    def setUp(self):
+        super().setUp()
+        self.base_dir = self.tmp_dir / "observations"
+        self.store = ObservationStore(base_dir=self.base_dir)
+
+    def test_stash_is_content_addressed(self):
+        """相同内容得到相同引用，只写一个文件，不留临时文件"""
+        ref = self.store.stash("hello")
+        self.assertTrue(ref.startswith(ObservationStore.REF_PREFIX))
+        self.assertEqual(self.store.stash("hello"), ref)
+        self.assertNotEqual(self.store.stash("world"), ref)
+        self.assertEqual(sorted(p.suffix for p in self.base_dir.iterdir()), [".txt", ".txt"])
+
+    def test_execute_reads_in_chunks(self):
+        """按offset/limit分段读取，has_more标记是否还有剩余"""
+        ref = self.store.stash("abcdefghij")
+        first = self.store.execute(ref, offset=0, limit=4)
+        self.assertEqual(first["content"], "abcd")
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["total_chars"], 10)
+        last = self.store.execute(ref, offset=8, limit=4)
+        self.assertEqual(last["content"], "ij")
+        self.assertFalse(last["has_more"])
+
+    def test_invalid_and_missing_refs(self):
+        """非法引用（如路径穿越）和不存在的归档返回错误"""
+        self.assertIn("error", self.store.execute("obs://../secret"))
+        self.assertIn("error", self.store.execute("obs://" + "0" * 32))
+
+
+if __name__ == "__main__":
+    unittest.main()
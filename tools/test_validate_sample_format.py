@@ -0,0 +1,113 @@
+"""
+样本格式验证单元测试 - 全量验证与增量验证
+"""
+import json
+import unittest
+
+from testutils import TempDirTestCase
+from tools.validate_sample_format import IncrementalJsonlValidator, validate_jsonl_file
+
+
+def _sample(data_id: str) -> dict:
+    return {
+        "data_id": data_id,
+        "query": "q",
+        "system": "s",
+        "servers": ["srv"],
+        "environment": [],
+        "check_list": [{"check_type": "t", "params": {}}],
+    }
+
+
+def _line(sample: dict) -> str:
+    return json.dumps(sample, ensure_ascii=False) + "\n"
+
+
+class TestValidateJsonlFile(TempDirTestCase):
+    """测试全量验证"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.tmp_dir / "eval.jsonl"
+
+    def test_max_errors_stops_early(self):
+        """错误数达到max_errors时停止并标记truncated"""
+        self.path.write_text("{bad\n" * 5)
+        result = validate_jsonl_file(self.path, max_errors=2)
+        self.assertFalse(result["valid"])
+        self.assertTrue(result["truncated"])
+        self.assertEqual(len(result["errors"]), 2)
+
+    def test_nan_accepted_like_json_loads(self):
+        """NaN/Infinity能被json.loads加载，不报JSON解析失败"""
+        sample = _sample("a")
+        sample["check_list"][0]["params"] = {"threshold": float("nan"), "max": float("inf")}
+        self.path.write_text(_line(sample))
+        result = validate_jsonl_file(self.path)
+        self.assertTrue(result["valid"], result["errors"])
+
+    def test_missing_file(self):
+        """文件不存在时返回不合规"""
+        result = validate_jsonl_file(self.path)
+        self.assertFalse(result["valid"])
+        self.assertEqual(result["error_summary"], "文件不存在")
+
+
+class TestIncrementalJsonlValidator(TempDirTestCase):
+    """测试增量验证：追加时只解析新行，改写时从头验证"""
+
+    def setUp(self):
+        super().setUp()
+        self.path = self.tmp_dir / "eval.jsonl"
+        self.validator = IncrementalJsonlValidator()
+
+    def test_append_keeps_offset(self):
+        """追加样本时已验证前缀保留，结果与全量验证一致"""
+        self.path.write_text(_line(_sample("a")) + _line(_sample("b")))
+        self.validator.validate(self.path)
+        offset = self.validator._offset
+        self.assertEqual(offset, self.path.stat().st_size)
+
+        with open(self.path, "a") as f:
+            f.write(_line({"data_id": "c"}))
+        result = self.validator.validate(self.path)
+        self.assertGreater(self.validator._offset, offset)
+        self.assertEqual(result, validate_jsonl_file(self.path))
+        self.assertEqual(result["total_samples"], 3)
+        self.assertEqual(result["valid_samples"], 2)
+
+    def test_rewrite_resets_offset(self):
+        """前缀被改写时从头验证，旧前缀中的错误不再计入"""
+        self.path.write_text(_line({"data_id": "bad"}) + _line(_sample("b")))
+        self.assertFalse(self.validator.validate(self.path)["valid"])
+
+        self.path.write_text(_line(_sample("a")) + _line(_sample("b")) + _line(_sample("c")))
+        result = self.validator.validate(self.path)
+        self.assertTrue(result["valid"])
+        self.assertEqual(result["total_samples"], 3)
+
+    def test_truncate_resets_offset(self):
+        """文件被截短时从头验证"""
+        self.path.write_text(_line(_sample("a")) + _line(_sample("b")))
+        self.validator.validate(self.path)
+        self.path.write_text(_line(_sample("a")))
+        result = self.validator.validate(self.path)
+        self.assertEqual(result["total_samples"], 1)
+        self.assertEqual(self.validator._offset, self.path.stat().st_size)
+
+    def test_unterminated_last_line_not_in_prefix(self):
+        """没有换行的最后一行参与验证，但不计入已验证前缀（可能还会被续写）"""
+        first = _line(_sample("a"))
+        self.path.write_text(first + json.dumps(_sample("b")))
+        result = self.validator.validate(self.path)
+        self.assertEqual(result["total_samples"], 2)
+        self.assertEqual(self.validator._offset, len(first.encode("utf-8")))
+
+        self.path.write_text(first + _line(_sample("b")))
+        result = self.validator.validate(self.path)
+        self.assertEqual(result["total_samples"], 2)
+        self.assertTrue(result["valid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
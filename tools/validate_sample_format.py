@@ -4,9 +4,20 @@
 
 验证生成的样本是否符合 sample_format_spec.json 规范
 """
+import hashlib
 import json
 import sys
 from pathlib import Path
+from typing import Optional
+
+import orjson
+
+# 必需字段（元组保持错误信息顺序稳定）
+REQUIRED_FIELDS = ("data_id", "query", "system", "servers", "environment", "check_list")
+
+# 不应该出现的字段（旧格式遗留）
+INVALID_FIELDS = ("sample_id", "template_id", "complexity", "description",
+                  "user_need", "initial_state", "metadata")
 
 
 def validate_sample(sample: dict) -> tuple[bool, list[str]]:
@@ -19,8 +30,7 @@ def validate_sample(sample: dict) -> tuple[bool, list[str]]:
     errors = []
     
     # 必需字段检查
-    required_fields = ["data_id", "query", "system", "servers", "environment", "check_list"]
-    for field in required_fields:
+    for field in REQUIRED_FIELDS:
         if field not in sample:
             errors.append(f"❌ 缺少必需字段: {field}")
     
@@ -71,93 +81,209 @@ def validate_sample(sample: dict) -> tuple[bool, list[str]]:
                     errors.append(f"❌ check_list[{i}] 缺少 params")
     
     # 检查是否有不应该存在的字段
-    invalid_fields = ["sample_id", "template_id", "complexity", "description", 
-                      "user_need", "initial_state", "metadata"]
-    for field in invalid_fields:
+    for field in INVALID_FIELDS:
         if field in sample:
             errors.append(f"⚠️  使用了错误的字段名: {field} (应该使用规范中的字段)")
     
     return len(errors) == 0, errors
 
 
-def validate_jsonl_file(filepath: Path) -> dict:
+def _check_line(line: bytes, line_num: int) -> tuple[bool, bool, list[str]]:
+    """
+    验证JSONL中的一行
+
+    Returns:
+        (是否计为样本, 样本是否合规, 带样本标识的错误列表)
+    """
+    try:
+        sample = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        # orjson不接受NaN/Infinity，下游用json加载时可以读取，以json.loads的结论为准
+        try:
+            sample = json.loads(line)
+        except ValueError as e:
+            return False, False, [f"[Line {line_num}] JSON解析失败: {e}"]
+
+    is_valid, errors = validate_sample(sample)
+    if is_valid:
+        return True, True, []
+
+    # 添加样本标识到错误信息
+    sample_id = sample.get('data_id') or sample.get('sample_id', f'Line {line_num}')
+    return True, False, [f"[{sample_id}] {error}" for error in errors]
+
+
+def _build_result(total_samples: int, valid_samples: int, all_errors: list[str],
+                  truncated: bool, line_num: int) -> dict:
+    """构建验证结果（line_num为停止验证时所在的行）"""
+    is_valid = len(all_errors) == 0
+
+    if is_valid:
+        error_summary = ""
+    else:
+        error_count = len(all_errors)
+        invalid_count = total_samples - valid_samples
+        if truncated:
+            error_summary = f"前 {total_samples} 个样本中已发现 {error_count} 个格式问题 (错误过多，已在第 {line_num} 行停止验证)"
+        else:
+            error_summary = f"发现 {error_count} 个格式问题 (影响 {invalid_count}/{total_samples} 个样本)"
+
+    return {
+        "valid": is_valid,
+        "total_samples": total_samples,
+        "valid_samples": valid_samples,
+        "errors": all_errors,
+        "error_summary": error_summary,
+        "truncated": truncated
+    }
+
+
+def _missing_file_result(filepath: Path) -> dict:
+    return {
+        "valid": False,
+        "total_samples": 0,
+        "valid_samples": 0,
+        "errors": [f"文件不存在: {filepath}"],
+        "error_summary": "文件不存在",
+        "truncated": False
+    }
+
+
+def _read_failed_result(e: Exception) -> dict:
+    return {
+        "valid": False,
+        "total_samples": 0,
+        "valid_samples": 0,
+        "errors": [f"读取文件失败: {str(e)}"],
+        "error_summary": "读取文件失败",
+        "truncated": False
+    }
+
+
+def validate_jsonl_file(filepath: Path, max_errors: Optional[int] = None) -> dict:
     """
-    验证JSONL样本文件
+    验证JSONL样本文件（逐行流式解析）
 
     Args:
         filepath: JSONL文件路径
+        max_errors: 收集到这么多错误后停止验证（None表示验证全部样本）
 
     Returns:
         {
             "valid": bool,
             "total_samples": int,
             "valid_samples": int,
-            "errors": list[str],  # 所有错误列表
-            "error_summary": str  # 错误摘要
+            "errors": list[str],  # 错误列表（指定max_errors时最多这么多条）
+            "error_summary": str,  # 错误摘要
+            "truncated": bool  # 是否因达到max_errors提前停止
         }
     """
     if not filepath.exists():
-        return {
-            "valid": False,
-            "total_samples": 0,
-            "valid_samples": 0,
-            "errors": [f"文件不存在: {filepath}"],
-            "error_summary": "文件不存在"
-        }
+        return _missing_file_result(filepath)
 
     total_samples = 0
     valid_samples = 0
     all_errors = []
+    truncated = False
+    line_num = 0
 
     try:
-        with open(filepath, 'r', encoding='utf-8') as f:
+        with open(filepath, 'rb') as f:
             for line_num, line in enumerate(f, 1):
+                if max_errors is not None and len(all_errors) >= max_errors:
+                    truncated = True
+                    break
+
                 if not line.strip():
                     continue
 
-                try:
-                    sample = json.loads(line)
-                    total_samples += 1
+                counted, is_valid, errors = _check_line(line, line_num)
+                total_samples += counted
+                valid_samples += is_valid
+                all_errors.extend(errors)
 
-                    is_valid, errors = validate_sample(sample)
+        return _build_result(total_samples, valid_samples, all_errors, truncated, line_num)
 
-                    if is_valid:
-                        valid_samples += 1
-                    else:
-                        # 添加样本标识到错误信息
-                        sample_id = sample.get('data_id') or sample.get('sample_id', f'Line {line_num}')
-                        for error in errors:
-                            all_errors.append(f"[{sample_id}] {error}")
+    except Exception as e:
+        return _read_failed_result(e)
 
-                except json.JSONDecodeError as e:
-                    all_errors.append(f"[Line {line_num}] JSON解析失败: {e}")
 
-        # 构建结果
-        is_valid = len(all_errors) == 0
+class IncrementalJsonlValidator:
+    """
+    增量验证JSONL样本文件
 
-        if is_valid:
-            error_summary = ""
-        else:
-            error_count = len(all_errors)
-            invalid_count = total_samples - valid_samples
-            error_summary = f"发现 {error_count} 个格式问题 (影响 {invalid_count}/{total_samples} 个样本)"
+    记录已验证前缀（完整的行）的长度和摘要。再次验证同一文件时，前缀未变化
+    则只解析新增的行（生成器逐条追加样本时，每次只验证新样本）；前缀变化
+    （文件被截断或改写）时从头验证。结果格式与 validate_jsonl_file 相同。
+    """
 
-        return {
-            "valid": is_valid,
-            "total_samples": total_samples,
-            "valid_samples": valid_samples,
-            "errors": all_errors,
-            "error_summary": error_summary
-        }
+    def __init__(self):
+        self.reset()
 
-    except Exception as e:
-        return {
-            "valid": False,
-            "total_samples": 0,
-            "valid_samples": 0,
-            "errors": [f"读取文件失败: {str(e)}"],
-            "error_summary": "读取文件失败"
-        }
+    def reset(self):
+        """丢弃已验证前缀，下次从头验证"""
+        self._offset = 0
+        self._prefix_digest = hashlib.blake2b(b"", digest_size=16).digest()
+        self._line_num = 0
+        self._total_samples = 0
+        self._valid_samples = 0
+        self._errors: list[str] = []
+
+    def validate(self, filepath: Path, max_errors: Optional[int] = None) -> dict:
+        """验证文件，max_errors含义同 validate_jsonl_file（已验证前缀中的错误也计入）"""
+        try:
+            data = filepath.read_bytes()
+        except FileNotFoundError:
+            self.reset()
+            return _missing_file_result(filepath)
+        except Exception as e:
+            self.reset()
+            return _read_failed_result(e)
+
+        prefix = data[:self._offset]
+        if len(prefix) < self._offset or hashlib.blake2b(prefix, digest_size=16).digest() != self._prefix_digest:
+            self.reset()
+
+        # 最后一行没有换行符时可能还会被续写，只验证、不计入已验证前缀
+        complete_end = data.rfind(b"\n") + 1
+        try:
+            truncated = self._consume(data, complete_end, max_errors)
+            total_samples, valid_samples, all_errors = self._total_samples, self._valid_samples, self._errors
+            line_num = self._line_num
+            if not truncated and complete_end < len(data) and data[complete_end:].strip():
+                if max_errors is not None and len(all_errors) >= max_errors:
+                    truncated = True
+                else:
+                    line_num += 1
+                    counted, is_valid, errors = _check_line(data[complete_end:], line_num)
+                    total_samples += counted
+                    valid_samples += is_valid
+                    all_errors = all_errors + errors
+        except Exception as e:
+            self.reset()
+            return _read_failed_result(e)
+
+        self._prefix_digest = hashlib.blake2b(data[:self._offset], digest_size=16).digest()
+        # 提前停止时报告停在的那一行（尚未验证）
+        stop_line = line_num + 1 if truncated else line_num
+        return _build_result(total_samples, valid_samples, list(all_errors), truncated, stop_line)
+
+    def _consume(self, data: bytes, end: int, max_errors: Optional[int]) -> bool:
+        """验证 data[self._offset:end] 中的完整行并计入已验证前缀，返回是否因max_errors提前停止"""
+        pos = self._offset
+        while pos < end:
+            if max_errors is not None and len(self._errors) >= max_errors:
+                return True
+            next_pos = data.index(b"\n", pos) + 1
+            line = data[pos:next_pos]
+            self._line_num += 1
+            if line.strip():
+                counted, is_valid, errors = _check_line(line, self._line_num)
+                self._total_samples += counted
+                self._valid_samples += is_valid
+                self._errors.extend(errors)
+            pos = self._offset = next_pos
+        return False
 
 
 def main():